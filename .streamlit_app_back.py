@@ -1,9 +1,11 @@
 import streamlit as st
 import datetime
 import requests
-import time
 from dateutil import parser 
 
+import ratelimit
+import servicetitan
+
 # OAuth2 Configuration
 client_id = st.secrets["client_id"]
 client_secret = st.secrets["client_secret"]
@@ -11,6 +13,22 @@ tenant = st.secrets["tenant"]
 st_app_key = st.secrets["st_app_key"]
 token_url = 'https://auth-integration.servicetitan.io/connect/token'
 
+# Request budgets per endpoint family (auth, jpm, dispatch, default) as [requests per second, burst],
+# shared with every other dashboard process on the host through the same state files
+rate_limits = {family: tuple(budget) for family, budget in st.secrets.get("rate_limits", {}).items()}
+rate_limit_state_path = st.secrets.get("rate_limit_state_path", "aq_dashboard.ratelimit")
+
+# Process-wide HTTP client: one keep-alive connection pool with retry/backoff for every API call,
+# each attempt drawing from the host-wide request budget
+@st.cache_resource
+def get_api_client():
+    return servicetitan.ApiClient(
+        pool_size=int(st.secrets.get("http_pool_size", 20)),
+        connect_timeout=float(st.secrets.get("http_connect_timeout", 5)),
+        read_timeout=float(st.secrets.get("http_read_timeout", 30)),
+        max_retries=int(st.secrets.get("http_max_retries", 4)),
+        rate_limiter=ratelimit.TokenBucketLimiter(rate_limits, state_path=rate_limit_state_path or None))
+
 # Function to get OAuth2 token
 def get_oauth_token(client_id, client_secret, token_url):
     data = {
@@ -18,27 +36,22 @@ def get_oauth_token(client_id, client_secret, token_url):
         'client_id': client_id,
         'client_secret': client_secret
     }
-    response = requests.post(token_url, data=data)
+    response = get_api_client().post(token_url, data=data)
     response.raise_for_status()  # Check if the request was successful    
     token_data = response.json()
     return token_data['access_token'], token_data['expires_in']
 
+# Process-wide token manager shared by every session (and persisted to disk when token_cache_path is set)
+@st.cache_resource
+def get_token_manager():
+    return servicetitan.TokenManager(
+        lambda: get_oauth_token(client_id, client_secret, token_url),
+        cache_path=st.secrets.get("token_cache_path"),
+        cache_key=f"{token_url}|{client_id}")
+
 # Function to get the cached token or request a new one
 def get_cached_token():
-    # Check if token is already in session state and still valid
-    if "token" in st.session_state and "token_expiration" in st.session_state:
-        if time.time() < st.session_state.token_expiration:
-            # Token is still valid, use it
-             return st.session_state.token
-    
-    # If no valid token, request a new one
-    token, expires_in = get_oauth_token(client_id, client_secret, token_url)
-    
-    # Cache the token and expiration time
-    st.session_state.token = token
-    st.session_state.token_expiration = time.time() + expires_in - 60  # Subtract 60 seconds as buffer
-    
-    return token
+    return get_token_manager().get_token()
 
 # Function to fetch appointments from API
 def fetch_appointments():
@@ -48,7 +61,7 @@ def fetch_appointments():
         'Authorization': f'Bearer {token}',
         'ST-App-Key': st_app_key  # Add ST-App-Key from secrets
     }
-    response = requests.get(appointmentList_url, headers=headers)
+    response = get_api_client().get(appointmentList_url, headers=headers)
     response.raise_for_status()
     return response.json()
 
@@ -60,7 +73,7 @@ def fetch_job_details(job_id):
         'Authorization': f'Bearer {token}',
         'ST-App-Key': st_app_key
     }
-    response = requests.get(job_url, headers=headers)
+    response = get_api_client().get(job_url, headers=headers)
     response.raise_for_status()
     return response.json()
 
@@ -1,10 +1,23 @@
 import streamlit as st
 import datetime
+import logging
 import requests
 import time
-from dateutil import parser 
+from pytz import timezone
+
+import assignments
+import ratelimit
+import roster
+import servicetitan
+import technicians
+import timestamps
 from datetime import datetime as dt, time as dtt
 
+logger = logging.getLogger(__name__)
+
+# Arizona Timezone (appointments and shifts are bucketed by their local date here)
+arizona_tz = timezone('America/Phoenix')
+
 
 current_time = dt.now()
 start_time = dtt(7,0)   # 7:00 AM
@@ -33,7 +46,10 @@ client_id = st.secrets["client_id"]
 client_secret = st.secrets["client_secret"]
 tenant = st.secrets["tenant"]
 st_app_key = st.secrets["st_app_key"]
-token_url = 'https://auth.servicetitan.io/connect/token'
+token_url = st.secrets.get("token_url", 'https://auth.servicetitan.io/connect/token')
+
+# API host; overridable so the app can run against a sandbox or a local stand-in
+api_base_url = st.secrets.get("api_base_url", 'https://api.servicetitan.io').rstrip('/')
 
 # Parameterized tagTypeIds for Op levels
 TAG_TYPE_IDS = {
@@ -43,6 +59,40 @@ TAG_TYPE_IDS = {
     "No_Op": 72  # "No Op"
 }
 
+# Appointments with several technicians count fully for each of them, or with
+# split_technician_credit an equal share for each (shown with decimals)
+split_technician_credit = bool(st.secrets.get("split_technician_credit", False))
+
+# Shift roster cache: full reload interval, how often to ask the API whether any shift
+# changed, and where the roster is kept across restarts (empty: memory only).
+# Add ?refresh_roster=1 to the URL to reload it now.
+roster_refresh_seconds = int(st.secrets.get("roster_refresh_seconds", 3600))
+roster_check_seconds = int(st.secrets.get("roster_check_seconds", 300))
+roster_cache_path = st.secrets.get("roster_cache_path", "aq_dashboard.roster.json")
+
+# Technician directory: full reload interval, how often to merge in modified technicians,
+# and where it is kept across restarts (empty: memory only). Add ?refresh_technicians=1
+# to the URL to reload it now.
+technicians_refresh_seconds = int(st.secrets.get("technicians_refresh_seconds", 86400))
+technicians_check_seconds = int(st.secrets.get("technicians_check_seconds", 900))
+technicians_cache_path = st.secrets.get("technicians_cache_path", "aq_dashboard.technicians.json")
+
+# Request budgets per endpoint family (auth, jpm, dispatch, default) as [requests per second, burst],
+# shared with every other dashboard process on the host through the same state files
+rate_limits = {family: tuple(budget) for family, budget in st.secrets.get("rate_limits", {}).items()}
+rate_limit_state_path = st.secrets.get("rate_limit_state_path", "aq_dashboard.ratelimit")
+
+# Process-wide HTTP client: one keep-alive connection pool with retry/backoff for every API call,
+# each attempt drawing from the host-wide request budget
+@st.cache_resource
+def get_api_client():
+    return servicetitan.ApiClient(
+        pool_size=int(st.secrets.get("http_pool_size", 20)),
+        connect_timeout=float(st.secrets.get("http_connect_timeout", 5)),
+        read_timeout=float(st.secrets.get("http_read_timeout", 30)),
+        max_retries=int(st.secrets.get("http_max_retries", 4)),
+        rate_limiter=ratelimit.TokenBucketLimiter(rate_limits, state_path=rate_limit_state_path or None))
+
 # Function to get OAuth2 token
 def get_oauth_token(client_id, client_secret, token_url):
     data = {
@@ -50,91 +100,160 @@ def get_oauth_token(client_id, client_secret, token_url):
         'client_id': client_id,
         'client_secret': client_secret
     }
-    response = requests.post(token_url, data=data)
+    response = get_api_client().post(token_url, data=data)
     response.raise_for_status()  # Check if the request was successful    
     token_data = response.json()
     return token_data['access_token'], token_data['expires_in']
 
+# Process-wide token manager shared by every session (and persisted to disk when token_cache_path is set)
+@st.cache_resource
+def get_token_manager():
+    return servicetitan.TokenManager(
+        lambda: get_oauth_token(client_id, client_secret, token_url),
+        cache_path=st.secrets.get("token_cache_path"),
+        cache_key=f"{token_url}|{client_id}")
+
 # Function to get the cached token or request a new one
 def get_cached_token():
-    # Check if token is already in session state and still valid
-    if "token" in st.session_state and "token_expiration" in st.session_state:
-        if time.time() < st.session_state.token_expiration:
-            # Token is still valid, use it
-            #token = get_oauth_token(client_id, client_secret, token_url)
-            #return token
-            return st.session_state.token
-    
-    # If no valid token, request a new one
-    token, expires_in = get_oauth_token(client_id, client_secret, token_url)
-    
-    # Cache the token and expiration time
-    st.session_state.token = token
-    st.session_state.token_expiration = time.time() + expires_in - 60  # Subtract 60 seconds as buffer
-    
-    return token
+    return get_token_manager().get_token()
 
-# Function to fetch shifts from the API for the next 5 days
+# Function to fetch one page of shifts from the API for the next 5 days
+def fetch_shifts_page(startDate, endDate, page, page_size):
+    shift_url = f'{api_base_url}/dispatch/v2/tenant/{tenant}/technician-shifts?startsOnOrAfter={startDate}&endsOnOrBefore={endDate}&shiftType=Normal&titleContains=Regular%20Shift&page={page}&pageSize={page_size}'
+    token = get_cached_token()
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'ST-App-Key': st_app_key
+    }
+    response = get_api_client().get(shift_url, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+# Function to stream shifts from the API page by page
 def fetch_shifts(startDate, endDate):
-    shift_url = f'https://api.servicetitan.io/dispatch/v2/tenant/{tenant}/technician-shifts?startsOnOrAfter={startDate}&endsOnOrBefore={endDate}&shiftType=Normal&titleContains=Regular%20Shift'
+    return servicetitan.iter_pages(lambda page, page_size: fetch_shifts_page(startDate, endDate, page, page_size))
+
+# Function to fetch one page of shifts modified since a UTC timestamp
+def fetch_modified_shifts_page(modified_since_utc, page, page_size):
+    shift_url = f'{api_base_url}/dispatch/v2/tenant/{tenant}/technician-shifts?modifiedOnOrAfter={modified_since_utc}&page={page}&pageSize={page_size}'
     token = get_cached_token()
     headers = {
         'Authorization': f'Bearer {token}',
         'ST-App-Key': st_app_key
     }
-    response = requests.get(shift_url, headers=headers)
+    response = get_api_client().get(shift_url, headers=headers)
     response.raise_for_status()
     return response.json()
 
-# Function to fetch appointments from API for the next 5 days
-def fetch_appointments(startDate, endDate):
-    appointmentList_url = f'https://api.servicetitan.io/jpm/v2/tenant/{tenant}/appointments?startsOnOrAfter={startDate}&startsBefore={endDate}&pageSize=100'
+# Function to stream shifts modified since a UTC timestamp page by page
+def fetch_modified_shifts(modified_since_utc):
+    return servicetitan.iter_pages(lambda page, page_size: fetch_modified_shifts_page(modified_since_utc, page, page_size))
+
+# Function to fetch one page of technicians (active or not) from the API
+def fetch_technicians_page(page, page_size):
+    technician_url = f'{api_base_url}/settings/v2/tenant/{tenant}/technicians?active=Any&page={page}&pageSize={page_size}'
+    token = get_cached_token()
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'ST-App-Key': st_app_key
+    }
+    response = get_api_client().get(technician_url, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+# Function to stream every technician page by page
+def fetch_technicians():
+    return servicetitan.iter_pages(fetch_technicians_page)
+
+# Function to fetch one page of technicians modified since a UTC timestamp
+def fetch_modified_technicians_page(modified_since_utc, page, page_size):
+    technician_url = f'{api_base_url}/settings/v2/tenant/{tenant}/technicians?active=Any&modifiedOnOrAfter={modified_since_utc}&page={page}&pageSize={page_size}'
+    token = get_cached_token()
+    headers = {
+        'Authorization': f'Bearer {token}',
+        'ST-App-Key': st_app_key
+    }
+    response = get_api_client().get(technician_url, headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+# Function to stream technicians modified since a UTC timestamp page by page
+def fetch_modified_technicians(modified_since_utc):
+    return servicetitan.iter_pages(lambda page, page_size: fetch_modified_technicians_page(modified_since_utc, page, page_size))
+
+# Process-wide technician directory (ID -> name, team) every view reads technician labels from
+@st.cache_resource
+def get_technician_directory():
+    return technicians.TechnicianDirectory(
+        fetch_technicians, fetch_modified_technicians,
+        refresh_interval=technicians_refresh_seconds, check_interval=technicians_check_seconds,
+        cache_path=technicians_cache_path or None)
+
+# Process-wide shift roster (local date -> technicians on shift), reloaded only when shifts change
+@st.cache_resource
+def get_shift_roster():
+    return roster.ShiftRoster(
+        fetch_shifts, fetch_modified_shifts, lambda starts: timestamps.local_dates(starts, arizona_tz).tolist(),
+        refresh_interval=roster_refresh_seconds, check_interval=roster_check_seconds,
+        cache_path=roster_cache_path or None)
+
+# Function to fetch one page of appointments from API for the next 5 days
+def fetch_appointments_page(startDate, endDate, page, page_size):
+    appointmentList_url = f'{api_base_url}/jpm/v2/tenant/{tenant}/appointments?startsOnOrAfter={startDate}&startsBefore={endDate}&page={page}&pageSize={page_size}'
     token = get_cached_token()  # Get the cached token or request a new one
     headers = {
         'Authorization': f'Bearer {token}',
         'ST-App-Key': st_app_key  # Add ST-App-Key from secrets
     }
-    response = requests.get(appointmentList_url, headers=headers)
+    response = get_api_client().get(appointmentList_url, headers=headers)
     response.raise_for_status()  # Check if the request was successful
     return response.json()
 
-# Function to fetch job details using jobId
-def fetch_job_details(job_id):
-    job_url = f'https://api.servicetitan.io/jpm/v2/tenant/{tenant}/jobs/{job_id}'
+# Function to fetch every appointment in the window, following the pages until hasMore is false
+def fetch_appointments(startDate, endDate):
+    return [appointment
+            for page in servicetitan.iter_pages(lambda page, page_size: fetch_appointments_page(startDate, endDate, page, page_size))
+            for appointment in page]
+
+# Function to fetch job details for one chunk of job IDs (up to 50 at a time)
+def fetch_job_details_chunk(job_ids):
+    job_url = f'{api_base_url}/jpm/v2/tenant/{tenant}/jobs?ids={",".join(map(str, job_ids))}&pageSize={len(job_ids)}'
     token = get_cached_token()
     headers = {
         'Authorization': f'Bearer {token}',
         'ST-App-Key': st_app_key
     }
-    response = requests.get(job_url, headers=headers)
+    response = get_api_client().get(job_url, headers=headers)
     response.raise_for_status()
-    return response.json()
+    return {job['id']: job for job in response.json().get('data', [])}
+
+# Function to fetch job details for any number of job IDs, chunked and fetched concurrently
+def fetch_job_details_bulk(job_ids):
+    return servicetitan.fetch_by_ids(fetch_job_details_chunk, job_ids)
 
-# Function to fetch technician assignments for appointments
-def fetch_appointment_assignments(appointment_ids):
-    assignment_url = f'https://api.servicetitan.io/dispatch/v2/tenant/{tenant}/appointment-assignments?appointmentIds={",".join(map(str, appointment_ids))}'
+# Function to fetch one page of technician assignments for a chunk of appointments
+def fetch_appointment_assignments(appointment_ids, page=1, page_size=servicetitan.DEFAULT_PAGE_SIZE):
+    assignment_url = f'{api_base_url}/dispatch/v2/tenant/{tenant}/appointment-assignments?appointmentIds={",".join(map(str, appointment_ids))}&page={page}&pageSize={page_size}'
     token = get_cached_token()
     headers = {
         'Authorization': f'Bearer {token}',
         'ST-App-Key': st_app_key
     }
-    response = requests.get(assignment_url, headers=headers)
+    response = get_api_client().get(assignment_url, headers=headers)
     response.raise_for_status()
     return response.json()
 
-def map_technician_names(appointments_data):
-    appointment_ids = [appointment['id'] for appointment in appointments_data.get('data', [])]
-    technician_mapping = {}
+# Function to fetch every technician assignment for one chunk of appointment IDs (an appointment can have several)
+def fetch_appointment_assignments_chunk(appointment_ids):
+    assignments = {}
+    for page in servicetitan.iter_pages(lambda page, page_size: fetch_appointment_assignments(appointment_ids, page, page_size)):
+        assignments.update((assignment['id'], assignment) for assignment in page)
+    return assignments
 
-    # Fetch assignments for the given appointment IDs
-    if appointment_ids:
-        assignments_data = fetch_appointment_assignments(appointment_ids)
-        for assignment in assignments_data.get('data', []):
-            technician_id = assignment['technicianId']
-            technician_name = assignment['technicianName']
-            technician_mapping[technician_id] = technician_name
+# Function to fetch the technician assignments for any number of appointments, chunked and fetched concurrently
+def fetch_appointment_assignments_bulk(appointment_ids):
+    return list(servicetitan.fetch_by_ids(fetch_appointment_assignments_chunk, appointment_ids).values())
 
-    return technician_mapping
 
 # Function to get the next valid weekday (skipping weekends)
 def get_next_weekday(current_day, days_ahead):
@@ -151,67 +270,31 @@ startDate = (datetime.datetime.now(datetime.timezone.utc).replace(hour=7, minute
 endDate = (datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=5)).replace(hour=7, minute=0, second=0, microsecond=0).strftime('%Y-%m-%dT%H:%M:%SZ')
 # Function to match appointments to dates and increase the metric count based on job tag
 
+# Function to get the local Arizona dates of all appointments in one pass (None, with an error shown, when one cannot be parsed)
+def get_appointment_dates(appointments):
+    appointment_dates = timestamps.local_dates([appointment['start'] for appointment in appointments], arizona_tz).tolist()
+    for appointment, appointment_date in zip(appointments, appointment_dates):
+        if appointment_date is None:
+            st.error(f"Error parsing date: {appointment['start']}")
+    return appointment_dates
+
 # Update process_appointments to include technician assignments and metrics
-def process_appointments(appointments_data, today, next_day, third_day):
-    # Appointments are inside the 'data' key
-    appointments = appointments_data.get('data', [])  # Extract appointments from 'data' key
-
-    # Initialize metric counts for each day and each tag type, mapped to technicians
-    metrics = {}
-    appointment_ids = []
-
-    # Collect all appointmentIds for fetching technician assignments later
-    for appointment in appointments:
-        appointment_ids.append(appointment['id'])
-
-    # Fetch technician assignments for all appointments
-    technician_assignments = fetch_appointment_assignments(appointment_ids)
-
-    # Process each appointment
-    for appointment in appointments:
-        try:
-            appointment_date = parser.parse(appointment['start']).date()
-        except Exception as e:
-            st.error(f"Error parsing date: {appointment['start']}, {e}")
-            continue
-
-        # Fetch the corresponding job details using jobId
-        job_details = fetch_job_details(appointment['jobId'])
-
-        # Get the assigned technician for the appointment
-        assignment = next((a for a in technician_assignments['data'] if a['appointmentId'] == appointment['id']), None)
-        if assignment:
-            technician_name = assignment['technicianName']
-        else:
-            technician_name = "Unknown"
-
-        # Initialize metrics for the technician if not already present
-        if technician_name not in metrics:
-            metrics[technician_name] = {
-                "Op_1": {"today": 0, "next_day": 0, "third_day": 0},
-                "Op_2": {"today": 0, "next_day": 0, "third_day": 0},
-                "Op_3": {"today": 0, "next_day": 0, "third_day": 0},
-                "No_Op": {"today": 0, "next_day": 0, "third_day": 0}
-            }
-
-        # Loop over the defined tag types (Op_1, Op_2, Op_3, No_Op)
-        
-        #st.write(TAG_TYPE_IDS.items())
-        for op_level, tag_id in TAG_TYPE_IDS.items():
-            if tag_id in job_details.get('tagTypeIds', []):
-                # Match appointment date to today, next_day, or third_day
-                
-                if appointment_date == today:
-                    metrics[technician_name][op_level]["today"] += 1
-                
-                elif appointment_date == next_day:
-                    metrics[technician_name][op_level]["next_day"] += 1
-                    
-                elif appointment_date == third_day:
-                    metrics[technician_name][op_level]["third_day"] += 1
-                    
-
-    return metrics
+# (assignments and job details are fetched once per run, in bulk, and joined through the assignment index)
+def process_appointments(appointments, assignment_index, job_details_dict, today, next_day, third_day):
+    # Count metrics per technician, tag type (Op_1, Op_2, Op_3, No_Op) and day
+    return assignments.count_by_technician(
+        appointments, assignment_index, job_details_dict, TAG_TYPE_IDS,
+        {today: "today", next_day: "next_day", third_day: "third_day"},
+        get_appointment_dates(appointments), split=split_technician_credit)
+
+
+# Function to get a technician's label from the directory (assignment names cover technicians it does not know yet)
+def get_technician_label(technician_id):
+    return technician_directory.name(technician_id) or technician_mapping.get(technician_id, "Unknown Tech")
+
+# Function to format a technician's count (split credit can leave fractions)
+def format_count(value):
+    return f"{round(value, 2):g}"
 
 
 # Function to get the name of the next weekday
@@ -229,8 +312,8 @@ def get_next_weekday2(current_day, days_ahead):
 #third_day_name = get_next_weekday(today, 4 - today.weekday()) if today.weekday() >= 5 else get_next_weekday(today, 2)
 
 
-# Get today's date
-today = datetime.date.today()
+# Get today's date (in Arizona, like the appointment and shift dates)
+today = datetime.datetime.now(arizona_tz).date()
 
 # Calculate the next valid weekdays (skipping weekends)
 next_day = get_next_weekday(today, 1)
@@ -244,32 +327,42 @@ third_day_name = third_day.strftime("%A")
 
 # Main logic to fetch and process shifts
 try:
-    # Fetch shifts from API for the next 5 days
-    shifts_data = fetch_shifts(startDate, endDate)
-
+    # Technicians on shift for the next 5 days, from the cached roster
+    shift_roster = get_shift_roster()
+    if st.query_params.get("refresh_roster"):
+        shift_roster.invalidate()
+    technicians_by_date = shift_roster.get(startDate, endDate)
 
     # Filter shifts by day and technicianId
-    technicians_today = []
-    technicians_next_day = []
-    technicians_third_day = []
+    technicians_today = list(technicians_by_date.get(today, ()))
+    technicians_next_day = list(technicians_by_date.get(next_day, ()))
+    technicians_third_day = list(technicians_by_date.get(third_day, ()))
+
+    # Now, fetch every appointment for the next 5 days (all pages)
+    appointments = fetch_appointments(startDate, endDate)
+
+    # Fetch the technician assignments and job details for all appointments once, in chunks
+    technician_assignments = fetch_appointment_assignments_bulk([appointment['id'] for appointment in appointments])
+    job_details_dict = fetch_job_details_bulk([appointment['jobId'] for appointment in appointments])
 
-    for shift in shifts_data.get('data', []):
-        shift_date = parser.parse(shift['start']).date()
-        if shift_date == today:
-            technicians_today.append(shift['technicianId'])
-        elif shift_date == next_day:
-            technicians_next_day.append(shift['technicianId'])
-        elif shift_date == third_day:
-            technicians_third_day.append(shift['technicianId'])
+    # Index the assignments once: appointmentId -> assignments and technicianId -> technicianName
+    assignment_index = assignments.AssignmentIndex(technician_assignments)
 
-    # Now, fetch appointments for the next 5 days
-    appointments_data = fetch_appointments(startDate, endDate)
+    # Bring the technician directory up to date (usually a no-op, at most one small incremental sync).
+    # Labels are only decoration: if the technicians call fails (e.g. the app key lacks the scope),
+    # keep the cached directory and the assignment names instead of blanking the board.
+    technician_directory = get_technician_directory()
+    try:
+        technician_directory.refresh(force=bool(st.query_params.get("refresh_technicians")))
+    except Exception:
+        logger.warning("Could not refresh the technician directory; using the cached one", exc_info=True)
 
-    # Create a mapping from technicianId to technicianName
-    technician_mapping = map_technician_names(appointments_data)
+    # Create a mapping from technicianId to technicianName: the directory, with assignment names
+    # for technicians it does not know yet
+    technician_mapping = assignment_index.names
 
      # Process appointments to count "Op 1," "Op 2," "Op 3," and "No Op"
-    appointment_metrics = process_appointments(appointments_data, today, next_day, third_day)
+    appointment_metrics = process_appointments(appointments, assignment_index, job_details_dict, today, next_day, third_day)
 
 
 except requests.RequestException as e:
@@ -371,14 +464,14 @@ with col1:
     """
     for technician in technicians_today:
         # Get technician name from the mapping
-        technician_name = technician_mapping.get(technician, "Unknown Tech")
+        technician_name = get_technician_label(technician)
         
         card_content_today += f"""<div class="metric-container">
                 <div class="technician-label">{technician_name}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('Op_1', {}).get('today', 0)}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('Op_2', {}).get('today', 0)}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('Op_3', {}).get('today', 0)}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('No_Op', {}).get('today', 0)}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('Op_1', {}).get('today', 0))}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('Op_2', {}).get('today', 0))}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('Op_3', {}).get('today', 0))}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('No_Op', {}).get('today', 0))}</div>
             </div>
         """
     card_content_today += "</div></div>"
@@ -402,13 +495,13 @@ with col2:
     """
     for technician in technicians_next_day:
          # Get technician name from the mapping
-        technician_name = technician_mapping.get(technician, "Unknown Tech")
+        technician_name = get_technician_label(technician)
         card_content_next_day += f"""<div class="metric-container">
                 <div class="technician-label">{technician_name}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('Op_1', {}).get('next_day', 0)}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('Op_2', {}).get('next_day', 0)}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('Op_3', {}).get('next_day', 0)}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('No_Op', {}).get('next_day', 0)}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('Op_1', {}).get('next_day', 0))}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('Op_2', {}).get('next_day', 0))}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('Op_3', {}).get('next_day', 0))}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('No_Op', {}).get('next_day', 0))}</div>
             </div>
         """
     card_content_next_day += "</div></div>"
@@ -431,13 +524,13 @@ with col3:
     """
     for technician in technicians_third_day:
          # Get technician name from the mapping
-        technician_name = technician_mapping.get(technician, "Unknown Tech")
+        technician_name = get_technician_label(technician)
         card_content_third_day += f""" <div class="metric-container">
 <div class="technician-label">{technician_name}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('Op_1', {}).get('third_day', 0)}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('Op_2', {}).get('third_day', 0)}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('Op_3', {}).get('third_day', 0)}</div>
-                <div class="metric-value">{appointment_metrics.get(technician_name, {}).get('No_Op', {}).get('third_day', 0)}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('Op_1', {}).get('third_day', 0))}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('Op_2', {}).get('third_day', 0))}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('Op_3', {}).get('third_day', 0))}</div>
+                <div class="metric-value">{format_count(appointment_metrics.get(technician, {}).get('No_Op', {}).get('third_day', 0))}</div>
             </div>
         """
     card_content_third_day += "</div></div>"
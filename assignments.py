@@ -0,0 +1,58 @@
+from collections import defaultdict
+
+# Key the counts of appointments without any technician assignment go under
+UNASSIGNED = None
+
+
+# Hash index over a batch of technician assignments, built once per refresh:
+# appointmentId -> its assignments (an appointment can have several technicians)
+# and technicianId -> technicianName, so every lookup is a dict access instead
+# of a scan over all assignments.
+class AssignmentIndex:
+    def __init__(self, assignments):
+        self.by_appointment = defaultdict(list)
+        self.names = {}
+        for assignment in assignments:
+            self.by_appointment[assignment['appointmentId']].append(assignment)
+            self.names[assignment['technicianId']] = assignment['technicianName']
+        self.by_appointment.default_factory = None
+
+    # Function to get the IDs of the technicians assigned to an appointment (first assigned first)
+    def technicians(self, appointment_id):
+        return [assignment['technicianId'] for assignment in self.by_appointment.get(appointment_id, ())]
+
+    # Function to get (technician ID, share) credits for an appointment: every assigned
+    # technician gets full credit, or with `split` an equal share of one; appointments
+    # without assignments are credited to UNASSIGNED
+    def credits(self, appointment_id, split=False):
+        technician_ids = list(dict.fromkeys(self.technicians(appointment_id))) or [UNASSIGNED]
+        share = 1 / len(technician_ids) if split else 1
+        return [(technician_id, share) for technician_id in technician_ids]
+
+
+# Function to count tagged appointments per technician, tag and day. `day_keys` maps a
+# local date to its key ("today", "next_day", ...) and `dates[i]` is the local date of
+# appointment i (None to leave it out). Returns
+# {technician ID: {tag name: {day key: count}}}.
+def count_by_technician(appointments, index, job_details_dict, tag_type_ids, day_keys, dates, split=False):
+    tag_names = {tag_type_id: name for name, tag_type_id in tag_type_ids.items()}
+    metrics = {}
+    for appointment, date in zip(appointments, dates):
+        day_key = day_keys.get(date)
+        if day_key is None:
+            continue
+        job = job_details_dict.get(appointment['jobId'])
+        if not job:
+            continue
+        tags = {tag_names[tag_type_id] for tag_type_id in job.get('tagTypeIds', ()) if tag_type_id in tag_names}
+        if not tags:
+            continue
+        for technician_id, share in index.credits(appointment['id'], split):
+            technician_metrics = metrics.get(technician_id)
+            if technician_metrics is None:
+                technician_metrics = metrics[technician_id] = {
+                    name: dict.fromkeys(day_keys.values(), 0) for name in tag_type_ids
+                }
+            for tag in tags:
+                technician_metrics[tag][day_key] += share
+    return metrics
@@ -0,0 +1,440 @@
+import argparse
+import bisect
+import datetime
+import gzip
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# Tag type IDs the dashboard tracks by default (see TAG_TYPE_IDS in streamlit_app.py)
+DEFAULT_TAG_TYPE_IDS = (74799391, 74798752, 74796076, 74799264, 74799011, 74796077)
+
+# Tag type IDs the dashboard does not track, mixed in so jobs look like a real tenant
+OTHER_TAG_TYPE_IDS = tuple(range(1000001, 1000041))
+
+STATUSES = ("Scheduled", "Dispatched", "Working", "Done", "Canceled")
+STATUS_WEIGHTS = (55, 15, 10, 15, 5)
+
+ISO_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+ROUTES = [
+    ("auth", re.compile(r"^/connect/token$")),
+    ("appointments", re.compile(r"^/jpm/v2/tenant/[^/]+/appointments$")),
+    ("jobs", re.compile(r"^/jpm/v2/tenant/[^/]+/jobs$")),
+    ("job", re.compile(r"^/jpm/v2/tenant/[^/]+/jobs/(\d+)$")),
+    ("technician-shifts", re.compile(r"^/dispatch/v2/tenant/[^/]+/technician-shifts$")),
+    ("appointment-assignments", re.compile(r"^/dispatch/v2/tenant/[^/]+/appointment-assignments$")),
+    ("technicians", re.compile(r"^/settings/v2/tenant/[^/]+/technicians$")),
+]
+
+
+def format_utc(dt):
+    return dt.astimezone(datetime.timezone.utc).strftime(ISO_FORMAT)
+
+
+def parse_utc(value):
+    return datetime.datetime.strptime(value, ISO_FORMAT).replace(tzinfo=datetime.timezone.utc)
+
+
+# Synthetic tenant: appointments, jobs, technicians, shifts and assignments.
+#
+# Appointments are generated lazily for every distinct [start, end) window the
+# client asks for, `appointments_per_window` at a time, so a tenant "size" is
+# exactly the number of appointments a dashboard refresh has to walk through.
+# Everything is derived from `seed`, so runs are repeatable.
+class MockTenant:
+    def __init__(self, appointments_per_window=1000, seed=1, tag_type_ids=DEFAULT_TAG_TYPE_IDS,
+                 tagged_fraction=0.35, technicians=None):
+        self.appointments_per_window = appointments_per_window
+        self.tag_type_ids = tuple(tag_type_ids)
+        self.tagged_fraction = tagged_fraction
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._windows = set()
+        self._next_id = 10_000_000
+        self.appointments = {}
+        self.jobs = {}
+        self.assignments = {}
+        # Appointments sorted by start, for range queries
+        self._starts = []
+        self._by_start = []
+
+        technician_count = technicians or max(5, appointments_per_window // 20)
+        self.technicians = [
+            {"id": 500_000 + i, "name": f"Tech {i:05d}", "team": f"Team {i % 8}", "active": True,
+             "modifiedOn": self._timestamp(days_ago=60)}
+            for i in range(technician_count)
+        ]
+        self.shifts = {}
+
+    def _new_id(self):
+        self._next_id += 1
+        return self._next_id
+
+    def _timestamp(self, days_ago=0):
+        return format_utc(datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=days_ago))
+
+    # Function to make sure the window [start, end) has its appointments (and their jobs, shifts, assignments)
+    def ensure_window(self, start, end):
+        with self._lock:
+            if (start, end) in self._windows:
+                return
+            self._windows.add((start, end))
+            start_dt, end_dt = parse_utc(start), parse_utc(end)
+            span = max(1, int((end_dt - start_dt).total_seconds()) - 3600)
+            # Records were booked well before the dashboard first looks at them
+            now = self._timestamp(days_ago=self._random.randint(1, 30))
+            job = None
+            for _ in range(self.appointments_per_window):
+                # About one job in five has a second appointment
+                if job is None or self._random.random() > 0.2:
+                    job = self._new_job(now)
+                appointment_start = start_dt + datetime.timedelta(seconds=self._random.randrange(0, span, 900))
+                self._add_appointment(self._new_appointment(job, appointment_start, now))
+            self._by_start.sort(key=lambda appointment: appointment["start"])
+            self._starts = [appointment["start"] for appointment in self._by_start]
+            self._add_shifts(start_dt, end_dt, now)
+
+    def _new_job(self, now):
+        tags = self._random.sample(OTHER_TAG_TYPE_IDS, self._random.randint(0, 3))
+        if self._random.random() < self.tagged_fraction:
+            tags.append(self._random.choice(self.tag_type_ids))
+        job_id = self._new_id()
+        job = {
+            "id": job_id,
+            "jobNumber": str(job_id),
+            "customerId": self._random.randint(1, 10 ** 7),
+            "locationId": self._random.randint(1, 10 ** 7),
+            "jobStatus": "Scheduled",
+            "businessUnitId": self._random.randint(1, 40),
+            "jobTypeId": self._random.randint(1, 200),
+            "priority": "Normal",
+            "campaignId": self._random.randint(1, 500),
+            "summary": "Synthetic job generated for benchmarking. " * self._random.randint(1, 5),
+            "tagTypeIds": tags,
+            "createdOn": now,
+            "modifiedOn": now,
+            "active": True,
+        }
+        self.jobs[job_id] = job
+        return job
+
+    def _new_appointment(self, job, start, now):
+        appointment_id = self._new_id()
+        status = self._random.choices(STATUSES, STATUS_WEIGHTS)[0]
+        return {
+            "id": appointment_id,
+            "jobId": job["id"],
+            "appointmentNumber": f"{job['jobNumber']}-1",
+            "start": format_utc(start),
+            "end": format_utc(start + datetime.timedelta(hours=2)),
+            "arrivalWindowStart": format_utc(start),
+            "arrivalWindowEnd": format_utc(start + datetime.timedelta(hours=4)),
+            "status": status,
+            "specialInstructions": None,
+            "createdOn": now,
+            "modifiedOn": now,
+            "customerId": job["customerId"],
+            "unused": False,
+            "active": self._random.random() > 0.02,
+        }
+
+    def _add_appointment(self, appointment):
+        self.appointments[appointment["id"]] = appointment
+        self._by_start.append(appointment)
+        technician = self._random.choice(self.technicians)
+        self.assignments[appointment["id"]] = {
+            "id": self._new_id(),
+            "technicianId": technician["id"],
+            "technicianName": technician["name"],
+            "appointmentId": appointment["id"],
+            "jobId": appointment["jobId"],
+            "assignedOn": appointment["createdOn"],
+            "status": "Working",
+            "isPaused": False,
+            "active": True,
+        }
+
+    def _add_shifts(self, start_dt, end_dt, now):
+        day = start_dt
+        while day < end_dt:
+            for technician in self.technicians:
+                shift_start = day.replace(hour=14, minute=0, second=0)
+                key = (technician["id"], shift_start.date())
+                if key not in self.shifts:
+                    self.shifts[key] = {
+                        "id": self._new_id(),
+                        "shiftType": "Normal",
+                        "title": "Regular Shift",
+                        "note": None,
+                        "active": True,
+                        "technicianId": technician["id"],
+                        "start": format_utc(shift_start),
+                        "end": format_utc(shift_start + datetime.timedelta(hours=9)),
+                        "createdOn": now,
+                        "modifiedOn": now,
+                    }
+            day += datetime.timedelta(days=1)
+
+    # Function to simulate activity between two refreshes: touch a fraction of the
+    # appointments (reschedule / cancel) and jobs (retag); returns how many of each changed
+    def touch(self, fraction=0.01):
+        with self._lock:
+            now = self._timestamp()
+            appointments = self._random.sample(list(self.appointments.values()),
+                                               int(len(self.appointments) * fraction))
+            for appointment in appointments:
+                appointment["status"] = self._random.choices(STATUSES, STATUS_WEIGHTS)[0]
+                appointment["modifiedOn"] = now
+            jobs = self._random.sample(list(self.jobs.values()), int(len(self.jobs) * fraction))
+            for job in jobs:
+                job["tagTypeIds"] = [self._random.choice(self.tag_type_ids)]
+                job["modifiedOn"] = now
+            return len(appointments), len(jobs)
+
+    def appointments_between(self, start, end):
+        return self._by_start[bisect.bisect_left(self._starts, start):bisect.bisect_left(self._starts, end)]
+
+
+# Local HTTP stand-in for the ServiceTitan auth, JPM and dispatch endpoints the
+# dashboards call. Latency (with jitter), page size caps and 429 injection are
+# configurable; per-endpoint call, throttle and byte counters are kept so a
+# benchmark can report how much traffic a refresh costs.
+class MockServiceTitan:
+    def __init__(self, tenant, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0,
+                 default_page_size=50, max_page_size=5000, rate_limit_fraction=0.0, retry_after=0,
+                 token_lifetime=900, seed=1):
+        self.tenant = tenant
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.default_page_size = default_page_size
+        self.max_page_size = max_page_size
+        self.rate_limit_fraction = rate_limit_fraction
+        self.retry_after = retry_after
+        self.token_lifetime = token_lifetime
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self.reset_counters()
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="mock-servicetitan", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counters(self):
+        with self._lock:
+            self.calls = defaultdict(int)
+            self.throttled = defaultdict(int)
+            self.bytes_sent = defaultdict(int)
+
+    def counters(self):
+        with self._lock:
+            return {
+                "calls": dict(self.calls),
+                "throttled": dict(self.throttled),
+                "bytes": dict(self.bytes_sent),
+                "total_calls": sum(self.calls.values()),
+                "total_throttled": sum(self.throttled.values()),
+                "total_bytes": sum(self.bytes_sent.values()),
+            }
+
+    def _handler_class(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                mock._handle(self)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                if length:
+                    self.rfile.read(length)
+                mock._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _delay(self):
+        delay = self.latency_ms + (self._random.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def _handle(self, request):
+        url = urlsplit(request.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        if url.path.startswith("/_mock/"):
+            self._control(request, url.path, params)
+            return
+        for name, pattern in ROUTES:
+            match = pattern.match(url.path)
+            if match:
+                break
+        else:
+            self._send(request, "unknown", 404, {"title": "Not Found"})
+            return
+
+        self._delay()
+        with self._lock:
+            self.calls[name] += 1
+            throttle = name != "auth" and self._random.random() < self.rate_limit_fraction
+            if throttle:
+                self.throttled[name] += 1
+        if throttle:
+            self._send(request, name, 429, {"title": "Too Many Requests"},
+                       {"Retry-After": str(self.retry_after)})
+            return
+
+        if name == "auth":
+            body = {"access_token": f"mock-{time.time_ns()}", "expires_in": self.token_lifetime,
+                    "token_type": "Bearer"}
+        elif name == "job":
+            job = self.tenant.jobs.get(int(match.group(1)))
+            if job is None:
+                self._send(request, name, 404, {"title": "Not Found"})
+                return
+            body = job
+        else:
+            body = self._page(getattr(self, "_list_" + name.replace("-", "_"))(params), params)
+        self._send(request, name, 200, body)
+
+    # Control endpoints for a harness in another process (not counted as API traffic):
+    # GET /_mock/counters, POST /_mock/reset, POST /_mock/touch?fraction=0.01
+    def _control(self, request, path, params):
+        status = 200
+        if path == "/_mock/counters":
+            body = self.counters()
+        elif path == "/_mock/reset":
+            self.reset_counters()
+            body = {}
+        elif path == "/_mock/touch":
+            appointments, jobs = self.tenant.touch(float(params.get("fraction", 0.01)))
+            body = {"appointments": appointments, "jobs": jobs}
+        else:
+            status, body = 404, {"title": "Not Found"}
+        payload = json.dumps(body).encode()
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def _page(self, records, params):
+        page = max(1, int(params.get("page", 1)))
+        page_size = min(self.max_page_size, max(1, int(params.get("pageSize", self.default_page_size))))
+        offset = (page - 1) * page_size
+        return {
+            "page": page,
+            "pageSize": page_size,
+            "hasMore": offset + page_size < len(records),
+            "totalCount": None,
+            "data": records[offset:offset + page_size],
+        }
+
+    def _list_appointments(self, params):
+        if "ids" in params:
+            return [self.tenant.appointments[i] for i in parse_ids(params["ids"]) if i in self.tenant.appointments]
+        if "modifiedOnOrAfter" in params:
+            since = params["modifiedOnOrAfter"]
+            return [a for a in self.tenant.appointments.values() if a["modifiedOn"] >= since]
+        start, end = params.get("startsOnOrAfter"), params.get("startsBefore")
+        if start and end:
+            self.tenant.ensure_window(start, end)
+            return self.tenant.appointments_between(start, end)
+        return list(self.tenant.appointments.values())
+
+    def _list_jobs(self, params):
+        if "ids" in params:
+            return [self.tenant.jobs[i] for i in parse_ids(params["ids"]) if i in self.tenant.jobs]
+        if "modifiedOnOrAfter" in params:
+            since = params["modifiedOnOrAfter"]
+            return [j for j in self.tenant.jobs.values() if j["modifiedOn"] >= since]
+        return list(self.tenant.jobs.values())
+
+    def _list_technician_shifts(self, params):
+        if "modifiedOnOrAfter" in params:
+            since = params["modifiedOnOrAfter"]
+            return [s for s in self.tenant.shifts.values() if s["modifiedOn"] >= since]
+        start, end = params.get("startsOnOrAfter", ""), params.get("endsOnOrBefore", "9999")
+        if start and end != "9999":
+            self.tenant.ensure_window(start, end)
+        return [s for s in self.tenant.shifts.values() if s["start"] >= start and s["end"] <= end]
+
+    def _list_technicians(self, params):
+        if "modifiedOnOrAfter" in params:
+            since = params["modifiedOnOrAfter"]
+            return [t for t in self.tenant.technicians if t["modifiedOn"] >= since]
+        return list(self.tenant.technicians)
+
+    def _list_appointment_assignments(self, params):
+        if "appointmentIds" in params:
+            ids = parse_ids(params["appointmentIds"])
+            return [self.tenant.assignments[i] for i in ids if i in self.tenant.assignments]
+        return list(self.tenant.assignments.values())
+
+    def _send(self, request, name, status, body, headers=None):
+        payload = json.dumps(body, separators=(",", ":")).encode()
+        gzipped = "gzip" in request.headers.get("Accept-Encoding", "")
+        if gzipped:
+            payload = gzip.compress(payload, compresslevel=5)
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        if gzipped:
+            request.send_header("Content-Encoding", "gzip")
+        for header, value in (headers or {}).items():
+            request.send_header(header, value)
+        request.end_headers()
+        request.wfile.write(payload)
+        with self._lock:
+            self.bytes_sent[name] += len(payload)
+
+
+def parse_ids(value):
+    return [int(i) for i in value.split(",") if i.strip().isdigit()]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run a local ServiceTitan stand-in with a synthetic tenant.")
+    arg_parser.add_argument("--appointments", type=int, default=1000, help="appointments per queried window")
+    arg_parser.add_argument("--port", type=int, default=8700)
+    arg_parser.add_argument("--latency-ms", type=float, default=0.0)
+    arg_parser.add_argument("--jitter-ms", type=float, default=0.0)
+    arg_parser.add_argument("--max-page-size", type=int, default=5000)
+    arg_parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of calls answered with 429")
+    arg_parser.add_argument("--retry-after", type=int, default=0)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    mock = MockServiceTitan(
+        MockTenant(args.appointments, seed=args.seed), port=args.port, latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms, max_page_size=args.max_page_size, rate_limit_fraction=args.rate_limit,
+        retry_after=args.retry_after, seed=args.seed).start()
+    print(f"Mock ServiceTitan on {mock.base_url} (token_url = {mock.base_url}/connect/token)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
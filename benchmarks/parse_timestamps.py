@@ -0,0 +1,77 @@
+import argparse
+import datetime
+import os
+import random
+import sys
+import time
+
+from dateutil import parser
+from pytz import timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import timestamps  # noqa: E402
+
+arizona_tz = timezone('America/Phoenix')
+
+
+# Function to generate `rows` ServiceTitan-style UTC timestamps over about a month,
+# a share of them with 7 fractional digits as the API sometimes sends
+def make_timestamps(rows, seed):
+    generator = random.Random(seed)
+    start = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+    values = []
+    for _ in range(rows):
+        instant = start + datetime.timedelta(seconds=generator.randint(-15 * 86400, 15 * 86400))
+        if generator.random() < 0.3:
+            values.append(instant.strftime('%Y-%m-%dT%H:%M:%S.') + f"{generator.randint(0, 9999999):07d}Z")
+        else:
+            values.append(instant.strftime('%Y-%m-%dT%H:%M:%SZ'))
+    return values
+
+
+# Function to time `function(values)`, best of `repeat` runs
+def best_of(function, values, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function(values)
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark timestamp parsing and Phoenix local-date bucketing against dateutil.")
+    arg_parser.add_argument("--rows", type=int, default=100000)
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    values = make_timestamps(args.rows, args.seed)
+    candidates = [
+        ("dateutil parser.parse + astimezone",
+         lambda column: [parser.parse(value).astimezone(arizona_tz).date() for value in column]),
+        ("dateutil parser.isoparse + astimezone",
+         lambda column: [parser.isoparse(value).astimezone(arizona_tz).date() for value in column]),
+        ("timestamps.local_date (per row)",
+         lambda column: [timestamps.local_date(value, arizona_tz) for value in column]),
+        ("timestamps.local_dates (batch)",
+         lambda column: timestamps.local_dates(column, arizona_tz).tolist()),
+    ]
+
+    print(f"{'method':<40} {'total ms':>10} {'ns/row':>8} {'speedup':>8}")
+    print("-" * 69)
+    baseline = expected = None
+    for name, function in candidates:
+        seconds, result = best_of(function, values, args.repeat)
+        if baseline is None:
+            baseline, expected = seconds, result
+        elif result != expected:
+            raise AssertionError(f"{name} disagrees with dateutil")
+        print(f"{name:<40} {seconds * 1000:>10.1f} {seconds / len(values) * 1e9:>8.0f} {baseline / seconds:>7.1f}x")
+    print(f"\n{len(values)} rows; every method returned the same Phoenix local dates.")
+
+
+if __name__ == "__main__":
+    main()
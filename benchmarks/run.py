@@ -0,0 +1,192 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_APP = os.path.join(os.path.dirname(BENCHMARK_DIR), "streamlit_app.py")
+DEFAULT_SIZES = (100, 1000, 10000, 100000)
+
+
+# Function to call one of the mock's control endpoints
+def mock_control(base_url, path, method="GET"):
+    request = urllib.request.Request(base_url + path, method=method, data=b"" if method == "POST" else None)
+    with urllib.request.urlopen(request) as response:
+        return json.load(response)
+
+
+# Function to find the app's snapshot poller (it lives in a cache_resource, out of the harness's reach):
+# the first poller of the scheduler thread that drives them
+def find_snapshot_poller():
+    for thread in threading.enumerate():
+        scheduler = getattr(getattr(thread, "_target", None), "__self__", None)
+        if getattr(scheduler, "pollers", None):
+            return scheduler.pollers[0]
+    return None
+
+
+# Function to wait until the poller has finished a refresh started after `since`
+def wait_for_refresh(poller, since, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if poller._last_attempt >= since and not poller.refreshing:
+            return poller.peek()
+        time.sleep(0.01)
+    raise TimeoutError("snapshot refresh did not finish in time")
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+# Child process: run the app once against the mock (cold start, full sync), then
+# time one background refresh after the mock has changed a slice of its data.
+def run_child(args):
+    from streamlit.testing.v1 import AppTest
+
+    workdir = tempfile.mkdtemp(prefix="aq-bench-")
+    secrets = {
+        "client_id": "bench", "client_secret": "bench", "tenant": "bench", "st_app_key": "bench",
+        "token_url": args.base_url + "/connect/token",
+        "api_base_url": args.base_url,
+        "store_path": os.path.join(workdir, "bench.db"),
+        "rate_limit_state_path": os.path.join(workdir, "ratelimit"),
+        "appointments_page_size": args.page_size,
+        "delta_sync": not args.no_delta,
+        "first_render_wait_seconds": args.timeout,
+        "snapshot_api_port": 0,
+        "server_push": False,
+        "http_max_retries": 8,
+    }
+    if args.api_budget:
+        # Same budget for every endpoint family instead of the app's defaults
+        secrets["rate_limits"] = {family: args.api_budget for family in ("auth", "jpm", "dispatch", "default")}
+
+    mock_control(args.base_url, "/_mock/reset", "POST")
+    baseline_rss = peak_rss_mb()
+    started = time.perf_counter()
+    app = AppTest.from_file(args.app, default_timeout=args.timeout)
+    app.secrets.update(secrets)
+    app.run()
+    cold_seconds = time.perf_counter() - started
+    if app.exception:
+        raise RuntimeError(app.exception[0].message)
+
+    poller = find_snapshot_poller()
+    metrics_snapshot = poller.peek()
+    if metrics_snapshot.error:
+        raise RuntimeError(metrics_snapshot.error)
+    cold = mock_control(args.base_url, "/_mock/counters")
+
+    mock_control(args.base_url, "/_mock/reset", "POST")
+    touched = mock_control(args.base_url, f"/_mock/touch?fraction={args.change_fraction}", "POST")
+    started_at, started = time.time(), time.perf_counter()
+    poller.refresh_now()
+    refreshed = wait_for_refresh(poller, started_at, args.timeout)
+    refresh_seconds = time.perf_counter() - started
+    refresh = mock_control(args.base_url, "/_mock/counters")
+
+    print(json.dumps({
+        "cold_seconds": cold_seconds,
+        "refresh_seconds": refresh_seconds,
+        "cold": cold,
+        "refresh": refresh,
+        "touched": touched,
+        "counted": sum(sum(day.counts.values()) for day in refreshed.days),
+        "days": len(refreshed.days),
+        "baseline_rss_mb": baseline_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "error": refreshed.error,
+    }))
+
+
+# Function to benchmark one tenant size: start the mock here, run the app in a fresh process
+def run_size(size, args):
+    sys.path.insert(0, BENCHMARK_DIR)
+    from mock_servicetitan import MockServiceTitan, MockTenant
+
+    mock = MockServiceTitan(
+        MockTenant(size, seed=args.seed), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+        max_page_size=args.max_page_size, rate_limit_fraction=args.rate_limit, retry_after=args.retry_after,
+        seed=args.seed).start()
+    try:
+        command = [sys.executable, os.path.abspath(__file__), "--child", "--base-url", mock.base_url,
+                   "--app", args.app, "--page-size", str(args.page_size), "--timeout", str(args.timeout),
+                   "--change-fraction", str(args.change_fraction)]
+        if args.api_budget:
+            command += ["--api-budget"] + [str(value) for value in args.api_budget]
+        if args.no_delta:
+            command.append("--no-delta")
+        completed = subprocess.run(command, capture_output=True, text=True, cwd=os.path.dirname(args.app))
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "child failed")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        mock.stop()
+    result["size"] = size
+    return result
+
+
+def print_report(results):
+    header = (f"{'appts':>7} {'cold s':>8} {'refresh s':>9} {'calls':>11} {'429s':>9} "
+              f"{'MB sent':>13} {'peak RSS MB':>11} {'counted':>8}")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        cold, refresh = r["cold"], r["refresh"]
+        print(f"{r['size']:>7} {r['cold_seconds']:>8.2f} {r['refresh_seconds']:>9.2f} "
+              f"{cold['total_calls']:>5}/{refresh['total_calls']:<5} "
+              f"{cold['total_throttled']:>4}/{refresh['total_throttled']:<4} "
+              f"{cold['total_bytes'] / 1e6:>6.2f}/{refresh['total_bytes'] / 1e6:<6.2f} "
+              f"{r['peak_rss_mb']:>11.0f} {r['counted']:>8}")
+    print("\ncalls, 429s and MB are cold start / refresh; the refresh follows "
+          "changes to a slice of the tenant's appointments and jobs.")
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark the dashboard's snapshot build against a local ServiceTitan stand-in.")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                            help="appointments per window for each synthetic tenant")
+    arg_parser.add_argument("--app", default=DEFAULT_APP)
+    arg_parser.add_argument("--latency-ms", type=float, default=20.0)
+    arg_parser.add_argument("--jitter-ms", type=float, default=10.0)
+    arg_parser.add_argument("--page-size", type=int, default=500, help="pageSize the app requests")
+    arg_parser.add_argument("--max-page-size", type=int, default=5000, help="largest pageSize the mock honors")
+    arg_parser.add_argument("--rate-limit", type=float, default=0.0, help="fraction of API calls answered with 429")
+    arg_parser.add_argument("--retry-after", type=int, default=0, help="Retry-After seconds sent with each 429")
+    arg_parser.add_argument("--change-fraction", type=float, default=0.01,
+                            help="share of appointments and jobs modified before the timed refresh")
+    arg_parser.add_argument("--api-budget", type=float, nargs=2, metavar=("RATE", "BURST"),
+                            help="request budget for every endpoint family (default: the app's own budgets)")
+    arg_parser.add_argument("--no-delta", action="store_true", help="benchmark the streaming (non-delta) path")
+    arg_parser.add_argument("--timeout", type=float, default=1800)
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--json", help="also write the raw results to this file")
+    arg_parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    arg_parser.add_argument("--base-url", help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    args.app = os.path.abspath(args.app)
+
+    if args.child:
+        run_child(args)
+        return
+
+    results = []
+    for size in args.sizes:
+        print(f"benchmarking {size} appointments per window…", file=sys.stderr)
+        results.append(run_size(size, args))
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+# Bounded in-memory cache with per-entry TTL and least-recently-used eviction.
+# Thread-safe; hit, miss, expiry and eviction counters are kept for tuning.
+class LRUTTLCache:
+    def __init__(self, max_entries=5000, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Function to look up many keys at once: returns ({key: value} for fresh hits, [missing or expired keys])
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        missing = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] > now:
+                    self._entries.move_to_end(key)
+                    found[key] = entry[1]
+                    self.hits += 1
+                    continue
+                if entry is not None:
+                    del self._entries[key]
+                    self.expirations += 1
+                missing.append(key)
+                self.misses += 1
+        return found, missing
+
+    def get(self, key, default=None):
+        found, _ = self.get_many([key])
+        return found.get(key, default)
+
+    def put_many(self, items):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            for key, value in items:
+                self._entries[key] = (expires_at, value)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def put(self, key, value):
+        self.put_many([(key, value)])
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,84 @@
+import hashlib
+import re
+
+from cache import LRUTTLCache
+
+# Card markup, split into the fixed frame and one row per level. The templates are
+# expanded for the configured levels once, when the renderer is created.
+CARD_TEMPLATE = """
+        <div class="card">{title}
+            <div class="metric-container ">
+                <div class="label-header">Level</div>
+                <div class="metric-header">Op</div>
+                <div class="metric-header">No Op</div>
+            </div>{rows}
+        </div>
+    """
+
+ROW_TEMPLATE = """
+            <div class="metric-container">
+                <div class="metric-label">Level {level}</div>
+                <div class="metric-value">{{{op_key}}}<span class="metric-delta {{{op_key}_color}}">{{{op_key}_delta}}</span></div>
+                <div class="metric-value">{{{no_op_key}}}<span class="metric-delta {{{no_op_key}_color}}">{{{no_op_key}_delta}}</span></div>
+            </div>"""
+
+LEVEL_KEY = re.compile(r"^L(\d+)_Op$")
+
+
+# Function to list the levels that have both an Op and a No Op tag (and a target for each)
+def get_levels(tag_keys, targets):
+    levels = []
+    for key in tag_keys:
+        match = LEVEL_KEY.match(key)
+        if match and f"L{match.group(1)}_No_Op" in tag_keys and key in targets \
+                and f"L{match.group(1)}_No_Op" in targets:
+            levels.append(int(match.group(1)))
+    return sorted(levels)
+
+
+# Determine colors for delta (red for negative, green for positive or zero)
+def get_delta_color(delta):
+    return "negative" if delta < 0 else "positive"
+
+
+# Day card renderer driven by the per-day counts. The card template is compiled
+# once for the configured levels; each card is then a single `str.format` call
+# and the result is kept under a hash of the card's title and counts, so a
+# rerun with unchanged numbers reuses the previous HTML instead of rebuilding it.
+class CardRenderer:
+    def __init__(self, levels, targets, max_cards=256):
+        self.levels = list(levels)
+        self.targets = dict(targets)
+        self.keys = [key for level in self.levels for key in (f"L{level}_Op", f"L{level}_No_Op")]
+        rows = "".join(
+            ROW_TEMPLATE.format(level=level, op_key=f"L{level}_Op", no_op_key=f"L{level}_No_Op")
+            for level in self.levels)
+        # Splice the compiled rows into the frame; what is left are the per-card fields
+        self._template = CARD_TEMPLATE.replace("{rows}", rows)
+        self._rendered = LRUTTLCache(max_entries=max_cards, ttl=24 * 3600)
+
+    # Function to hash what a card shows, so unchanged cards can be recognized across reruns
+    def card_hash(self, title, counts):
+        content = repr((title, tuple(int(counts.get(key, 0)) for key in self.keys)))
+        return hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+    def render(self, title, counts):
+        key = self.card_hash(title, counts)
+        html = self._rendered.get(key)
+        if html is None:
+            html = self._format(title, counts)
+            self._rendered.put(key, html)
+        return html
+
+    def _format(self, title, counts):
+        cells = {"title": title}
+        for key in self.keys:
+            count = int(counts.get(key, 0))
+            delta = self.targets[key] - count
+            cells[key] = count
+            cells[f"{key}_delta"] = delta
+            cells[f"{key}_color"] = get_delta_color(delta)
+        return self._template.format(**cells)
+
+    def stats(self):
+        return self._rendered.stats()
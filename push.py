@@ -0,0 +1,94 @@
+import logging
+import threading
+
+# Server-to-session push relies on Streamlit runtime internals; when they are
+# missing (older/newer Streamlit, AppTest, bare `python`) push is unavailable
+# and the app keeps its timed fragment reruns instead.
+try:
+    from streamlit.proto.ClientState_pb2 import ClientState
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner import get_script_run_ctx
+except ImportError:
+    ClientState = Runtime = get_script_run_ctx = None
+
+try:
+    from streamlit.runtime.scriptrunner_utils.script_run_context import ThreadState
+except ImportError:
+    ThreadState = None
+
+logger = logging.getLogger(__name__)
+
+
+# Function to get the ID of the fragment currently running on this thread (None outside a fragment)
+def current_fragment_id(ctx):
+    if ThreadState is not None:
+        try:
+            return ThreadState.get().fragment_id
+        except (RuntimeError, AttributeError):
+            pass
+    return getattr(ctx, 'current_fragment_id', None)
+
+
+# Registry of connected sessions that want a fragment rerun whenever the shared
+# snapshot changes. A session subscribes from inside the fragment to be rerun;
+# `notify()` (called on the poller thread) schedules that fragment's rerun on
+# each live session's event loop and forgets sessions that have disconnected.
+class SessionNotifier:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    # True when this process can push reruns to its sessions
+    @staticmethod
+    def available():
+        return Runtime is not None and Runtime.exists() and get_script_run_ctx() is not None
+
+    # Function to subscribe the current session's running fragment; returns whether push is wired up
+    def subscribe(self):
+        if not self.available():
+            return False
+        ctx = get_script_run_ctx()
+        fragment_id = current_fragment_id(ctx)
+        if ctx is None or not fragment_id:
+            return False
+        with self._lock:
+            self._subscribers[ctx.session_id] = (fragment_id, ctx.page_script_hash, ctx.query_string)
+        return True
+
+    def unsubscribe(self, session_id):
+        with self._lock:
+            self._subscribers.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    # Function to rerun the subscribed fragment of every live session; returns how many were notified
+    def notify(self):
+        if Runtime is None or not Runtime.exists():
+            return 0
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+
+        session_mgr = Runtime.instance()._session_mgr
+        notified = 0
+        for session_id, (fragment_id, page_script_hash, query_string) in subscribers:
+            session_info = session_mgr.get_active_session_info(session_id)
+            if session_info is None:
+                self.unsubscribe(session_id)
+                continue
+            client_state = ClientState(fragment_id=fragment_id, page_script_hash=page_script_hash,
+                                       query_string=query_string)
+            session = session_info.session
+            last_client_state = getattr(session, '_client_state', None)
+            if last_client_state is not None:
+                # Keep the session's widget values; a rerun replaces them with what it carries
+                client_state.widget_states.CopyFrom(last_client_state.widget_states)
+            try:
+                # AppSession is not thread-safe; hand the rerun to its event loop
+                session._event_loop.call_soon_threadsafe(session.request_rerun, client_state)
+            except Exception:
+                logger.warning("Could not push a rerun to session %s", session_id, exc_info=True)
+                self.unsubscribe(session_id)
+                continue
+            notified += 1
+        return notified
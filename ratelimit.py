@@ -0,0 +1,139 @@
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets are shared between threads only
+    fcntl = None
+
+# Budgets per endpoint family: (requests per second, burst size). Families without
+# their own entry share the "default" budget.
+DEFAULT_BUDGETS = {
+    'auth': (1.0, 5),
+    'jpm': (20.0, 40),
+    'dispatch': (20.0, 40),
+    'default': (10.0, 20),
+}
+
+# On-disk bucket state: available tokens and the time they were last topped up
+BUCKET_STATE = struct.Struct('<dd')
+
+
+# Token-bucket limiter with one bucket per endpoint family, so this app stays
+# inside its share of the tenant's API quota however many viewers it has.
+#
+# Buckets live in memory, or with `state_path` in small files next to it
+# (`<state_path>.<family>`) guarded by a file lock, so every worker process on
+# the host draws from the same budget. `acquire(family)` blocks until a token is
+# available; `usage()` reports the current budgets for metrics and debugging.
+class TokenBucketLimiter:
+    def __init__(self, budgets=None, state_path=None):
+        self.budgets = {family: (float(rate), float(burst))
+                        for family, (rate, burst) in {**DEFAULT_BUDGETS, **(budgets or {})}.items()}
+        self.state_path = state_path if fcntl is not None else None
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._files = {}
+        self.acquired = {}
+        self.waited = {}
+
+    def _budget(self, family):
+        return family if family in self.budgets else 'default'
+
+    # Function to take one token from the family's bucket, sleeping until one is available;
+    # returns the seconds spent waiting
+    def acquire(self, family):
+        family = self._budget(family)
+        waited = 0.0
+        while True:
+            wait = self._try_take(family)
+            if wait <= 0:
+                break
+            time.sleep(wait)
+            waited += wait
+        with self._lock:
+            self.acquired[family] = self.acquired.get(family, 0) + 1
+            self.waited[family] = self.waited.get(family, 0.0) + waited
+        return waited
+
+    # Take a token if there is one (returns 0), otherwise return how long until there will be
+    def _try_take(self, family):
+        rate, burst = self.budgets[family]
+        with self._lock, self._state(family) as state:
+            now = time.time()
+            tokens, updated = state.read(burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            if tokens >= 1:
+                state.write(tokens - 1, now)
+                return 0.0
+            state.write(tokens, now)
+            return (1 - tokens) / rate
+
+    def _state(self, family):
+        if self.state_path is None:
+            return _MemoryState(self._buckets, family)
+        state_file = self._files.get(family)
+        if state_file is None:
+            fd = os.open(f'{self.state_path}.{family}', os.O_RDWR | os.O_CREAT, 0o600)
+            state_file = self._files[family] = _FileState(fd)
+        return state_file
+
+    # Function to report each budget: rate, burst, tokens available now and this process's totals
+    def usage(self):
+        report = {}
+        for family, (rate, burst) in self.budgets.items():
+            with self._lock, self._state(family) as state:
+                now = time.time()
+                tokens, updated = state.read(burst, now)
+            report[family] = {
+                'rate': rate,
+                'burst': burst,
+                'available': round(min(burst, tokens + max(0.0, now - updated) * rate), 2),
+                'acquired': self.acquired.get(family, 0),
+                'waited_seconds': round(self.waited.get(family, 0.0), 3),
+            }
+        return report
+
+
+class _MemoryState:
+    def __init__(self, buckets, family):
+        self._buckets = buckets
+        self._family = family
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def read(self, burst, now):
+        return self._buckets.get(self._family, (burst, now))
+
+    def write(self, tokens, updated):
+        self._buckets[self._family] = (tokens, updated)
+
+
+# Bucket state in a file shared by every process on the host, held under an exclusive lock
+class _FileState:
+    def __init__(self, fd):
+        self._fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return False
+
+    def read(self, burst, now):
+        data = os.pread(self._fd, BUCKET_STATE.size, 0)
+        if len(data) < BUCKET_STATE.size:
+            # New bucket: start full
+            return burst, now
+        return BUCKET_STATE.unpack(data)
+
+    def write(self, tokens, updated):
+        os.pwrite(self._fd, BUCKET_STATE.pack(tokens, updated), 0)
@@ -0,0 +1,124 @@
+import datetime
+import json
+import os
+import threading
+import time
+
+# Overlap subtracted from the last check so shift edits racing it are not missed
+CHECK_OVERLAP_SECONDS = 60
+
+
+# Process-wide cache of the technician shift roster: local date -> technician IDs
+# on shift that day (in roster order, without duplicates).
+#
+# Shifts are set days ahead and rarely change during the day, so the window is
+# downloaded in full only when it moves, every `refresh_interval` seconds, or
+# after `invalidate()`. In between, every `check_interval` seconds a single
+# modified-since query asks whether any shift changed, and only a change
+# triggers a full reload. With `cache_path` the roster is persisted, so restarts
+# (and other worker processes on the host) start from it instead of the API.
+#
+# The fetch callables are supplied by the app:
+#   fetch_shifts(start, end)      -> iterable of shift pages in the window
+#   fetch_modified_shifts(since)  -> iterable of pages of shifts modified since then
+# and `local_dates(starts)` maps a page's shift start timestamps to the dates they are listed under.
+class ShiftRoster:
+    def __init__(self, fetch_shifts, fetch_modified_shifts, local_dates, refresh_interval=3600, check_interval=300,
+                 cache_path=None):
+        self._fetch_shifts = fetch_shifts
+        self._fetch_modified_shifts = fetch_modified_shifts
+        self._local_dates = local_dates
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+        self._cache_path = cache_path
+        self._lock = threading.Lock()
+        self._window = None
+        self._by_date = {}
+        self._fetched_at = 0.0
+        self._checked_at = 0.0
+        self.full_fetches = 0
+        self.checks = 0
+        self._load()
+
+    # Function to get {local date: tuple of technician IDs} for the window [start, end], refreshing when due
+    def get(self, start, end):
+        with self._lock:
+            now = time.time()
+            window = [start, end]
+            if self._window != window or now - self._fetched_at >= self.refresh_interval:
+                self._fetch(window, now)
+            elif now - self._checked_at >= self.check_interval:
+                self.checks += 1
+                if self._modified_since(self._checked_at - CHECK_OVERLAP_SECONDS):
+                    self._fetch(window, now)
+                else:
+                    self._checked_at = now
+                    self._save()
+            return self._by_date
+
+    # Drop the cached roster so the next `get` downloads the window again
+    def invalidate(self):
+        with self._lock:
+            self._window = None
+
+    # Function to describe the cache for the debug panel
+    def stats(self):
+        return {
+            'days': len(self._by_date),
+            'technician_shifts': sum(len(technician_ids) for technician_ids in self._by_date.values()),
+            'fetched_seconds_ago': round(time.time() - self._fetched_at) if self._fetched_at else None,
+            'checked_seconds_ago': round(time.time() - self._checked_at) if self._checked_at else None,
+            'full_fetches': self.full_fetches,
+            'checks': self.checks,
+        }
+
+    def _fetch(self, window, now):
+        by_date = {}
+        for shifts in self._fetch_shifts(*window):
+            for shift, day in zip(shifts, self._local_dates([shift['start'] for shift in shifts])):
+                if day is not None:
+                    by_date.setdefault(day, {})[shift['technicianId']] = None
+        self._by_date = {day: tuple(technician_ids) for day, technician_ids in by_date.items()}
+        self._window = window
+        self._fetched_at = self._checked_at = now
+        self.full_fetches += 1
+        self._save()
+
+    def _modified_since(self, since):
+        since = datetime.datetime.fromtimestamp(since, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        return any(shifts for shifts in self._fetch_modified_shifts(since))
+
+    # Adopt a persisted roster (it is re-validated by the usual window, refresh and check rules)
+    def _load(self):
+        if self._cache_path is None:
+            return
+        try:
+            with open(self._cache_path) as f:
+                cached = json.load(f)
+            by_date = {datetime.date.fromisoformat(day): tuple(technician_ids)
+                       for day, technician_ids in cached['by_date'].items()}
+            window, fetched_at, checked_at = cached['window'], cached['fetched_at'], cached['checked_at']
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        self._by_date, self._window, self._fetched_at, self._checked_at = by_date, window, fetched_at, checked_at
+
+    def _save(self):
+        if self._cache_path is None:
+            return
+        tmp_path = f'{self._cache_path}.{os.getpid()}.tmp'
+        try:
+            # Write-then-rename so readers never see a partial file
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'window': self._window,
+                    'fetched_at': self._fetched_at,
+                    'checked_at': self._checked_at,
+                    'by_date': {day.isoformat(): list(technician_ids) for day, technician_ids in self._by_date.items()},
+                }, f)
+            os.replace(tmp_path, self._cache_path)
+        except OSError:
+            # Persistence is best effort; the in-memory roster is still valid
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
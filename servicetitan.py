@@ -0,0 +1,317 @@
+import email.utils
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, the in-process lock still applies
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying, and the subset where the server may send Retry-After
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+RETRY_AFTER_STATUSES = frozenset({429, 503})
+
+# Default number of records requested per page from list endpoints
+DEFAULT_PAGE_SIZE = 500
+
+# Most IDs the API accepts in one `ids=` filter, and the default fan-out for chunked lookups
+MAX_IDS_PER_REQUEST = 50
+DEFAULT_MAX_WORKERS = 10
+
+
+# Function to read a Retry-After header (delta-seconds or HTTP date) as seconds to wait
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+# Function to name the API family a URL belongs to ("auth", "jpm", "dispatch", ...), used to label
+# metrics and pick a rate budget
+def endpoint_family(url):
+    parts = urlsplit(url)
+    if parts.path.rstrip('/').endswith('/connect/token'):
+        return 'auth'
+    segment = parts.path.lstrip('/').split('/', 1)[0]
+    return segment or 'other'
+
+
+# Shared HTTP client for every ServiceTitan call: one keep-alive connection pool
+# (so requests reuse TCP+TLS connections), gzip negotiation, default timeouts and
+# retries with jittered exponential backoff that honor Retry-After on 429/503.
+# With `metrics` (a telemetry.Metrics), calls, retries, latency and payload sizes
+# are recorded per endpoint family; with `rate_limiter` (a ratelimit.TokenBucketLimiter)
+# every attempt, retries included, first takes a token from its family's budget
+# (a `rate_limiter=` argument to a single call overrides it, e.g. per tenant).
+class ApiClient:
+    def __init__(self, pool_size=20, connect_timeout=5, read_timeout=30,
+                 max_retries=4, backoff_base=0.5, backoff_max=30, retry_after_max=120, metrics=None,
+                 rate_limiter=None):
+        self.timeout = (connect_timeout, read_timeout)
+        self.metrics = metrics
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_after_max = retry_after_max
+
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = 'gzip, deflate'
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    # Seconds to sleep before retry number `attempt` (0-based), using "full jitter"
+    def backoff_delay(self, attempt, response=None):
+        if response is not None and response.status_code in RETRY_AFTER_STATUSES:
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if retry_after is not None:
+                return min(retry_after, self.retry_after_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, url, rate_limiter=None, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        rate_limiter = rate_limiter or self.rate_limiter
+        family = endpoint_family(url)
+        attempt = 0
+        while True:
+            if rate_limiter is not None:
+                waited = rate_limiter.acquire(family)
+                if waited and self.metrics is not None:
+                    self.metrics.inc('rate_limit_wait_seconds_total', waited, family=family)
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                self._record(family, type(e).__name__, started)
+                if attempt >= self.max_retries:
+                    raise
+                self._record_retry(family, type(e).__name__)
+                time.sleep(self.backoff_delay(attempt))
+            else:
+                self._record(family, response.status_code, started, response)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    return response
+                self._record_retry(family, response.status_code)
+                delay = self.backoff_delay(attempt, response)
+                response.close()
+                time.sleep(delay)
+            attempt += 1
+
+    def _record(self, family, outcome, started, response=None):
+        if self.metrics is None:
+            return
+        self.metrics.observe('api_request_seconds', time.perf_counter() - started, family=family)
+        self.metrics.inc('api_requests_total', family=family, status=outcome)
+        if response is not None:
+            self.metrics.inc('api_response_bytes_total', len(response.content), family=family)
+
+    def _record_retry(self, family, reason):
+        if self.metrics is not None:
+            self.metrics.inc('api_retries_total', family=family, reason=reason)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+
+# Process-wide OAuth token manager. Concurrent callers share one token and only
+# one of them refreshes it (single-flight). Inside the `refresh_ahead` window a
+# single caller refreshes early while the others keep using the current token;
+# past `refresh_margin` before expiry everyone waits for the refresh. With
+# `cache_path` the token is persisted so restarts and other worker processes on
+# the host reuse it, and a file lock keeps refreshes single-flight across them.
+class TokenManager:
+    def __init__(self, fetch_token, cache_path=None, cache_key=None, refresh_margin=60, refresh_ahead=300):
+        self._fetch_token = fetch_token
+        self._cache_path = cache_path
+        self._cache_key = cache_key
+        self._refresh_margin = refresh_margin
+        self._refresh_ahead = refresh_ahead
+        self._lock = threading.Lock()
+        self._token = None
+        self._refresh_at = 0.0
+        self._usable_until = 0.0
+
+    def get_token(self):
+        now = time.time()
+        if self._token and now < self._refresh_at:
+            return self._token
+
+        if self._token and now < self._usable_until:
+            # Still usable: refresh early only if nobody else is already doing it
+            if not self._lock.acquire(blocking=False):
+                return self._token
+        else:
+            self._lock.acquire()
+        try:
+            return self._refresh_locked()
+        except Exception:
+            # A failed early refresh is retried on a later call; only fail once the token is unusable
+            if self._token and time.time() < self._usable_until:
+                logger.warning("Token refresh failed; keeping the current token for %.0f s",
+                               self._usable_until - time.time(), exc_info=True)
+                return self._token
+            raise
+        finally:
+            self._lock.release()
+
+    # Drop the current token (e.g. after a 401) so the next call fetches a new one
+    def invalidate(self):
+        with self._lock:
+            self._token = None
+            self._refresh_at = self._usable_until = 0.0
+
+    # Seconds until the current token must no longer be used (0 if there is none)
+    def expires_in(self):
+        return max(0.0, self._usable_until - time.time()) if self._token else 0.0
+
+    def _set(self, token, issued_at, expires_at):
+        lifetime = expires_at - issued_at
+        self._token = token
+        self._usable_until = expires_at - min(self._refresh_margin, lifetime / 4)
+        # Short-lived tokens start refreshing halfway through instead of immediately
+        self._refresh_at = expires_at - min(self._refresh_ahead, lifetime / 2)
+
+    def _refresh_locked(self):
+        # Another thread may have refreshed while we waited for the lock
+        if self._token and time.time() < self._refresh_at:
+            return self._token
+        if self._load():
+            return self._token
+        if self._cache_path is None or fcntl is None:
+            self._fetch()
+            return self._token
+
+        with open(self._cache_path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                # Another process may have refreshed while we waited for the file lock
+                if not self._load():
+                    self._fetch()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+        return self._token
+
+    def _fetch(self):
+        issued_at = time.time()
+        token, expires_in = self._fetch_token()
+        self._set(token, issued_at, issued_at + expires_in)
+        self._save(issued_at, issued_at + expires_in)
+
+    # Adopt a persisted token if it belongs to the same credentials and is not due for refresh
+    def _load(self):
+        if self._cache_path is None:
+            return False
+        try:
+            with open(self._cache_path) as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if cached.get('key') != self._cache_key or not cached.get('access_token'):
+            return False
+        issued_at = cached.get('issued_at', 0)
+        expires_at = cached.get('expires_at', 0)
+        lifetime = expires_at - issued_at
+        if lifetime <= 0 or time.time() >= expires_at - min(self._refresh_ahead, lifetime / 2):
+            return False
+        self._set(cached['access_token'], issued_at, expires_at)
+        return True
+
+    def _save(self, issued_at, expires_at):
+        if self._cache_path is None:
+            return
+        tmp_path = f'{self._cache_path}.{os.getpid()}.tmp'
+        try:
+            # Write-then-rename so readers never see a partial file; owner-only permissions
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'key': self._cache_key, 'access_token': self._token,
+                           'issued_at': issued_at, 'expires_at': expires_at}, f)
+            os.replace(tmp_path, self._cache_path)
+        except OSError:
+            # Persistence is best effort; the in-memory token is still valid
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+# Function to stream a paginated ServiceTitan list endpoint one page at a time.
+# `fetch_page(page, page_size)` returns the decoded JSON body; pages are walked
+# until `hasMore` is false. With `prefetch`, the next page is requested on a
+# worker thread while the caller is still processing the current one.
+def iter_pages(fetch_page, page_size=DEFAULT_PAGE_SIZE, prefetch=False):
+    if not prefetch:
+        page = 1
+        while True:
+            page_data = fetch_page(page, page_size)
+            items = page_data.get('data', [])
+            if items:
+                yield items
+            if not page_data.get('hasMore') or not items:
+                return
+            page += 1
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-prefetch")
+    pending = None
+    try:
+        page = 1
+        pending = executor.submit(fetch_page, page, page_size)
+        while pending is not None:
+            page_data = pending.result()
+            items = page_data.get('data', [])
+            has_more = bool(page_data.get('hasMore')) and bool(items)
+            page += 1
+            pending = executor.submit(fetch_page, page, page_size) if has_more else None
+            if items:
+                yield items
+    finally:
+        # The caller may stop early; drop any page still in flight
+        if pending is not None:
+            pending.cancel()
+        executor.shutdown(wait=False)
+
+
+
+# Function to split a list into consecutive chunks of at most `size` items
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+# Function to look up records by ID in API-sized chunks on a bounded worker pool.
+# IDs are deduplicated (keeping first-seen order); `fetch_chunk(ids)` returns a
+# dict of id -> record and the per-chunk results are merged into one map.
+def fetch_by_ids(fetch_chunk, ids, chunk_size=MAX_IDS_PER_REQUEST, max_workers=DEFAULT_MAX_WORKERS):
+    chunks = chunked(list(dict.fromkeys(ids)), chunk_size)
+    if not chunks:
+        return {}
+    if len(chunks) == 1:
+        return fetch_chunk(chunks[0])
+
+    records = {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks)), thread_name_prefix="id-lookup") as executor:
+        for chunk_records in executor.map(fetch_chunk, chunks):
+            records.update(chunk_records)
+    return records
@@ -0,0 +1,123 @@
+import datetime
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: every replica leads (and polls) on its own
+    fcntl = None
+
+from snapshot import DayMetrics, MetricsSnapshot
+
+logger = logging.getLogger(__name__)
+
+# File header: magic, format, snapshot version, built_at, day count, tag key count, metadata length
+SNAPSHOT_MAGIC = b"AQSNAP\x00\x00"
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_HEADER = struct.Struct("<8sIQdIII")
+
+
+# Snapshot shared by every replica of the app on one host through a versioned file.
+#
+# One replica leads: it holds an exclusive lock on `<path>.lock` for as long as it
+# runs, builds snapshots from the API and writes each one to a temporary file that
+# is then renamed over `path`, so readers only ever see a complete snapshot. The
+# other replicas follow: `read()` memory-maps the current file, decodes the day
+# ordinals and counts straight out of the mapping, and keeps the result until the
+# file is swapped again, so a read between swaps is a single stat(). When the
+# leader exits its lock is released and the next follower to call `lead()` takes over.
+#
+# Layout: SNAPSHOT_HEADER, the metadata JSON (tag keys, error, extra), padding to
+# 8 bytes, then day ordinals and the day x tag count matrix as little-endian int64.
+class SharedSnapshot:
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.Lock()
+        self._lock_fd = None
+        self._leading = fcntl is None
+        self._cached_stat = None
+        self._cached = None
+
+    @property
+    def leading(self):
+        return self._leading
+
+    # Function to try to become the leader (non-blocking); returns True while this process leads
+    def lead(self):
+        with self._lock:
+            if self._leading:
+                return True
+            fd = self._lock_fd
+            if fd is None:
+                fd = self._lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            # The pid is for whoever inspects the lock file; the lock itself is what counts
+            os.ftruncate(fd, 0)
+            os.pwrite(fd, str(os.getpid()).encode(), 0)
+            self._leading = True
+            logger.info("Leading snapshot builds for %s", self.path)
+            return True
+
+    # Function to publish a snapshot to every replica (atomic swap of the file)
+    def write(self, metrics_snapshot):
+        days = metrics_snapshot.days
+        tag_keys = list(days[0].counts) if days else []
+        meta = json.dumps({"keys": tag_keys, "error": metrics_snapshot.error, "extra": metrics_snapshot.extra},
+                          separators=(",", ":"), default=str).encode()
+        padding = -(SNAPSHOT_HEADER.size + len(meta)) % 8
+        numbers = [day.date.toordinal() for day in days]
+        numbers += [int(day.counts.get(key, 0)) for day in days for key in tag_keys]
+        body = b"".join((
+            SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_FORMAT, metrics_snapshot.version,
+                                 metrics_snapshot.built_at, len(days), len(tag_keys), len(meta)),
+            meta,
+            b"\x00" * padding,
+            struct.pack(f"<{len(numbers)}q", *numbers),
+        ))
+        temporary_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(body)
+        os.replace(temporary_path, self.path)
+
+    # Function to get the latest published snapshot, or None before the leader's first write
+    def read(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            if file_id == self._cached_stat:
+                return self._cached
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            metrics_snapshot = decode_snapshot(mapped)
+        with self._lock:
+            self._cached_stat, self._cached = file_id, metrics_snapshot
+        return metrics_snapshot
+
+
+# Function to decode a snapshot from a buffer in the SharedSnapshot layout
+def decode_snapshot(buffer):
+    magic, file_format, version, built_at, day_count, key_count, meta_length = SNAPSHOT_HEADER.unpack_from(buffer, 0)
+    if magic != SNAPSHOT_MAGIC or file_format != SNAPSHOT_FORMAT:
+        raise ValueError("not a shared snapshot file")
+    offset = SNAPSHOT_HEADER.size
+    meta = json.loads(bytes(buffer[offset:offset + meta_length]))
+    offset += meta_length + (-(offset + meta_length) % 8)
+    ordinals = struct.unpack_from(f"<{day_count}q", buffer, offset)
+    counts = struct.unpack_from(f"<{day_count * key_count}q", buffer, offset + 8 * day_count)
+    days = tuple(
+        DayMetrics(date=datetime.date.fromordinal(ordinal),
+                   counts=dict(zip(meta["keys"], counts[position * key_count:(position + 1) * key_count])))
+        for position, ordinal in enumerate(ordinals)
+    )
+    return MetricsSnapshot(version=version, built_at=built_at, days=days, error=meta["error"],
+                           extra=meta["extra"] or {})
@@ -0,0 +1,283 @@
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+
+# Metrics for one dashboard day: the local date and the count for each tag key
+@dataclass(frozen=True)
+class DayMetrics:
+    date: object
+    counts: dict
+
+    @property
+    def name(self):
+        return self.date.strftime("%A")
+
+
+# One immutable, versioned set of per-day metrics shared by every viewer session
+@dataclass(frozen=True)
+class MetricsSnapshot:
+    version: int
+    built_at: float
+    days: tuple
+    error: str = None
+    extra: dict = field(default_factory=dict)
+
+    def age(self, now=None):
+        return (now if now is not None else time.time()) - self.built_at
+
+
+# Process-wide poller: rebuilds the snapshot on a schedule in the background and
+# every session only reads the latest result, so API traffic does not grow with
+# the number of connected viewers. Pollers run on a PollScheduler, either their
+# own or one shared with other pollers (e.g. one per tenant).
+#
+# With `shared` (a shared_snapshot.SharedSnapshot) several replicas on one host
+# poll as one: the replica that leads builds and writes each snapshot for the
+# others, and the rest only read the leader's file every `follow_interval` seconds.
+class SnapshotPoller:
+    def __init__(self, build, interval, should_poll=None, seed=None, name="metrics-snapshot-poller",
+                 shared=None, follow_interval=5):
+        self._build = build
+        self._seed = seed
+        self._interval = interval
+        self._shared = shared
+        self._follow_interval = follow_interval
+        self._should_poll = should_poll or (lambda: True)
+        self._name = name
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._ready = threading.Event()
+        self._snapshot = None
+        self._version = 0
+        self._last_attempt = 0.0
+        self._refreshing = False
+        self._listeners = []
+        self._started = False
+        self._next_run = 0.0
+        self._scheduler = None
+
+    def start(self, scheduler=None):
+        with self._lock:
+            if self._scheduler is None:
+                self._scheduler = scheduler or PollScheduler(name=self._name)
+                add = True
+            else:
+                add = False
+        if add:
+            self._scheduler.add(self)
+        return self
+
+    # Return the latest snapshot, waiting up to `timeout` seconds for the first build.
+    # Meant for a viewer's full run: outside of polling hours nothing refreshes on its
+    # own, so asking for a stale snapshot wakes the poller for one rebuild.
+    def get(self, timeout=None):
+        self._ready.wait(timeout)
+        snapshot = self._snapshot
+        if snapshot is not None and time.time() - self._last_attempt > self._interval:
+            self.refresh_now()
+        return snapshot
+
+    # Return the latest snapshot (None before the first build) without waiting or waking
+    # the poller; for fragments, scrapes and other passive readers
+    def peek(self):
+        return self._snapshot
+
+    # True while a rebuild is running; sessions keep showing the current snapshot meanwhile
+    @property
+    def refreshing(self):
+        return self._refreshing or self._wake.is_set()
+
+    # True unless this replica follows another replica's shared snapshot
+    @property
+    def leading(self):
+        return self._shared is None or self._shared.leading
+
+    # Ask the poller to rebuild immediately instead of waiting for the next tick
+    def refresh_now(self):
+        if not self._wake.is_set():
+            self._wake.set()
+            if self._scheduler is not None:
+                self._scheduler.wake()
+
+    # Call `listener(snapshot)` on the poller thread every time the snapshot version advances
+    def subscribe(self, listener):
+        with self._lock:
+            self._listeners.append(listener)
+
+    # The version only advances when the numbers (or the error) change; a rebuild that
+    # finds the same data just refreshes `built_at`, so nothing downstream reruns for it.
+    # Followers take the leader's `version` so every replica reports the same one.
+    def _publish(self, days, error=None, extra=None, built_at=None, version=None):
+        days = tuple(days)
+        with self._lock:
+            previous = self._snapshot
+            changed = previous is None or previous.days != days or previous.error != error
+            if version is not None:
+                self._version = version
+            elif changed:
+                self._version += 1
+            self._snapshot = MetricsSnapshot(
+                version=self._version,
+                built_at=built_at if built_at is not None else time.time(),
+                days=days,
+                error=error,
+                extra=extra or {},
+            )
+            listeners = list(self._listeners) if changed else []
+            published = self._snapshot
+        if version is None and self._shared is not None:
+            try:
+                self._shared.write(published)
+            except OSError:
+                logger.warning("Could not write the shared snapshot %s", self._shared.path, exc_info=True)
+        self._ready.set()
+        for listener in listeners:
+            try:
+                listener(published)
+            except Exception:
+                # A failing listener must not stop the poller
+                logger.exception("Snapshot listener %r of %s failed", listener, self._name)
+
+    def _refresh(self):
+        self._last_attempt = time.time()
+        self._refreshing = True
+        try:
+            days = self._build()
+        except Exception as e:
+            previous = self._snapshot
+            if previous is None:
+                # Nothing to fall back to yet; publish an empty snapshot carrying the error
+                self._publish((), error=str(e))
+            else:
+                # Keep serving the last good numbers and surface the failure
+                self._publish(previous.days, error=str(e), extra=previous.extra,
+                              built_at=previous.built_at)
+            return
+        finally:
+            self._refreshing = False
+        self._publish(days)
+
+    # Publish whatever local data (e.g. the on-disk store) can answer with before the first API refresh.
+    # `seed()` returns (days, built_at) or None when there is nothing local yet.
+    def _publish_seed(self):
+        try:
+            seeded = self._seed()
+        except Exception:
+            return
+        if seeded and seeded[0]:
+            days, built_at = seeded
+            self._publish(days, extra={'seeded': True}, built_at=built_at)
+
+    # Publish the leader's latest snapshot when its file has been swapped since the last read
+    def _follow(self):
+        self._last_attempt = time.time()
+        try:
+            shared = self._shared.read()
+        except (OSError, ValueError):
+            logger.warning("Could not read the shared snapshot %s", self._shared.path, exc_info=True)
+            return
+        current = self._snapshot
+        if shared is not None and (current is None or (shared.version, shared.built_at) != (current.version, current.built_at)):
+            self._publish(shared.days, error=shared.error, extra=shared.extra, built_at=shared.built_at,
+                          version=shared.version)
+
+    # Seconds until this poller needs its scheduler again (0: now)
+    def _due_in(self, now):
+        if not self._started or self._wake.is_set():
+            return 0.0
+        return max(0.0, self._next_run - now)
+
+    # One scheduler turn: seed and build on the first, then rebuild when woken, or on
+    # each interval while `should_poll()` holds. A follower reads the leader's file instead,
+    # and tries to take over the lead every turn.
+    def _tick(self):
+        if self._shared is not None and not self._shared.lead():
+            self._wake.clear()
+            self._follow()
+            self._next_run = time.time() + self._follow_interval
+            return
+        if not self._started:
+            if self._seed is not None and self._snapshot is None:
+                self._publish_seed()
+            self._wake.clear()
+            self._refresh()
+            self._started = True
+        else:
+            woken = self._wake.is_set()
+            self._wake.clear()
+            if woken or self._should_poll():
+                self._refresh()
+        self._next_run = time.time() + self._interval
+
+
+# One background thread scheduling any number of pollers (e.g. one per tenant) and
+# handing their due builds to a small pool of `max_workers` threads, with at most
+# one build in flight per poller, so a tenant stuck in backoff or a slow request
+# does not hold up the others.
+class PollScheduler:
+    def __init__(self, name="snapshot-scheduler", max_workers=4):
+        self._name = name
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pollers = []
+        self._running = set()
+        self._due = queue.SimpleQueue()
+        self._max_workers = max_workers
+        self._workers = []
+        self._thread = None
+
+    @property
+    def pollers(self):
+        return list(self._pollers)
+
+    def add(self, poller):
+        with self._lock:
+            self._pollers.append(poller)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self._name, daemon=True)
+                self._thread.start()
+            # Daemon workers, so a build stuck in backoff never holds up shutdown
+            while len(self._workers) < min(self._max_workers, len(self._pollers)):
+                worker = threading.Thread(target=self._work, name=f"{self._name}-worker-{len(self._workers)}",
+                                          daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        self._wake.set()
+
+    # Re-check the pollers now (one of them was asked to refresh)
+    def wake(self):
+        self._wake.set()
+
+    def _work(self):
+        while True:
+            poller = self._due.get()
+            try:
+                poller._tick()
+            except Exception:
+                logger.exception("Snapshot poller %s failed", poller._name)
+            finally:
+                with self._lock:
+                    self._running.discard(poller)
+                # Its next run (or a refresh asked for meanwhile) is due from now on
+                self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            pollers = self.pollers
+            now = time.time()
+            with self._lock:
+                due = [poller for poller in pollers
+                       if poller not in self._running and poller._due_in(now) <= 0]
+                self._running.update(due)
+                idle = [poller for poller in pollers if poller not in self._running]
+            for poller in due:
+                self._due.put(poller)
+            # Pollers with a build in flight wake the scheduler when it finishes
+            now = time.time()
+            self._wake.wait(min((poller._due_in(now) for poller in idle), default=None))
@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger(__name__)
+
+
+# Read-only HTTP endpoint serving the current metrics snapshot as JSON, for wall
+# TVs and other tools that should not run a Streamlit session to read it.
+#
+# `get_snapshot(key)` returns the shared snapshot for `key` (the `key_param`
+# query parameter, e.g. ?tenant=north, or None without one): None before the
+# first build, or a KeyError for an unknown key. `to_json(key, snapshot)` turns
+# it into a JSON-serializable dict. The encoded body and its ETag are computed
+# once per snapshot, so a poll is a lookup plus, with a matching If-None-Match,
+# an empty 304.
+class SnapshotEndpoint:
+    def __init__(self, get_snapshot, to_json, host="0.0.0.0", port=8502, path="/metrics.json", key_param=None):
+        self._get_snapshot = get_snapshot
+        self._to_json = to_json
+        self.host = host
+        self.port = port
+        self.path = path
+        self.key_param = key_param
+        self._lock = threading.Lock()
+        self._encoded = {}
+        self._server = None
+
+    # Function to start serving on a daemon thread; returns None if the port cannot be bound
+    # (e.g. another server process on this host already serves it)
+    def start(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                endpoint._handle(self, send_body=True)
+
+            def do_HEAD(self):
+                endpoint._handle(self, send_body=False)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.warning("Snapshot endpoint not started on %s:%s: %s", self.host, self.port, e)
+            return None
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="snapshot-endpoint", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # Function to get (etag, body) for a key's snapshot, encoding it only the first time it is seen
+    def encode(self, key, metrics_snapshot):
+        with self._lock:
+            encoded = self._encoded.get(key)
+            if encoded is None or encoded[0] is not metrics_snapshot:
+                body = json.dumps(self._to_json(key, metrics_snapshot), separators=(",", ":")).encode()
+                etag = '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+                encoded = self._encoded[key] = (metrics_snapshot, etag, body)
+            return encoded[1:]
+
+    def _handle(self, request, send_body):
+        url = urlsplit(request.path)
+        if url.path != self.path:
+            self._send(request, 404, b'{"error":"not found"}', send_body)
+            return
+        key = parse_qs(url.query).get(self.key_param, [None])[-1] if self.key_param else None
+        try:
+            metrics_snapshot = self._get_snapshot(key)
+        except KeyError:
+            self._send(request, 404, b'{"error":"unknown key"}', send_body)
+            return
+        if metrics_snapshot is None:
+            self._send(request, 503, b'{"error":"no snapshot yet"}', send_body, {"Retry-After": "5"})
+            return
+
+        etag, body = self.encode(key, metrics_snapshot)
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            self._send(request, 304, b"", False, headers)
+            return
+        self._send(request, 200, body, send_body, headers)
+
+    @staticmethod
+    def _send(request, status, body, send_body, headers=None):
+        request.send_response(status)
+        if status != 304:
+            request.send_header("Content-Type", "application/json")
+            request.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        if send_body:
+            request.wfile.write(body)
+
+
+# Function to check an If-None-Match header ("*", or a list of possibly weak ETags) against an ETag
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
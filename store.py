@@ -0,0 +1,114 @@
+import json
+import sqlite3
+import threading
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY,
+    job_id INTEGER NOT NULL,
+    start TEXT NOT NULL,
+    local_date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS appointments_by_local_date ON appointments (local_date, job_id);
+
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS job_tags (
+    job_id INTEGER NOT NULL,
+    tag_type_id INTEGER NOT NULL,
+    PRIMARY KEY (job_id, tag_type_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS job_tags_by_tag_type ON job_tags (tag_type_id, job_id);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+# Local SQLite store of the synced appointments, jobs and job tag IDs.
+#
+# The database runs in WAL mode so any number of readers (sessions, other
+# processes) can query while the single writer (the sync engine) commits.
+# Every thread gets its own connection. `local_date(start)` maps an appointment
+# start timestamp to the local date string it is bucketed under.
+class Store:
+    def __init__(self, path, local_date):
+        self.path = path
+        self._local_date = local_date
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    # Function to load the working set: ({appointment_id: appointment}, {job_id: job})
+    def load(self):
+        conn = self._connection()
+        appointments = {
+            row[0]: {'id': row[0], 'jobId': row[1], 'start': row[2]}
+            for row in conn.execute('SELECT id, job_id, start FROM appointments')
+        }
+        jobs = {row[0]: {'id': row[0], 'tagTypeIds': []} for row in conn.execute('SELECT id FROM jobs')}
+        for job_id, tag_type_id in conn.execute('SELECT job_id, tag_type_id FROM job_tags ORDER BY job_id, tag_type_id'):
+            if job_id in jobs:
+                jobs[job_id]['tagTypeIds'].append(tag_type_id)
+        return appointments, jobs
+
+    def get_state(self, key, default=None):
+        row = self._connection().execute('SELECT value FROM sync_state WHERE key = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    # Apply one sync's changes (and the new sync state) in a single transaction
+    def apply(self, upsert_appointments=(), delete_appointment_ids=(), upsert_jobs=(), delete_job_ids=(),
+              replace=False, state=None):
+        conn = self._connection()
+        with conn:
+            if replace:
+                conn.execute('DELETE FROM appointments')
+                conn.execute('DELETE FROM jobs')
+                conn.execute('DELETE FROM job_tags')
+            conn.executemany('DELETE FROM appointments WHERE id = ?', [(i,) for i in delete_appointment_ids])
+            conn.executemany(
+                'INSERT OR REPLACE INTO appointments (id, job_id, start, local_date) VALUES (?, ?, ?, ?)',
+                [(a['id'], a['jobId'], a['start'], self._local_date(a['start'])) for a in upsert_appointments])
+
+            delete_job_ids = list(delete_job_ids)
+            conn.executemany('DELETE FROM jobs WHERE id = ?', [(i,) for i in delete_job_ids])
+            conn.executemany('DELETE FROM job_tags WHERE job_id = ?', [(i,) for i in delete_job_ids])
+            upsert_jobs = list(upsert_jobs)
+            conn.executemany('INSERT OR IGNORE INTO jobs (id) VALUES (?)', [(j['id'],) for j in upsert_jobs])
+            conn.executemany('DELETE FROM job_tags WHERE job_id = ?', [(j['id'],) for j in upsert_jobs])
+            conn.executemany(
+                'INSERT OR IGNORE INTO job_tags (job_id, tag_type_id) VALUES (?, ?)',
+                [(j['id'], tag_type_id) for j in upsert_jobs for tag_type_id in j.get('tagTypeIds', [])])
+
+            for key, value in (state or {}).items():
+                conn.execute('INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    # Function to count appointments per (local date, tag type) with one indexed query
+    def count_tags(self, local_dates, tag_type_ids):
+        local_dates = [str(local_date) for local_date in local_dates]
+        tag_type_ids = list(tag_type_ids)
+        if not local_dates or not tag_type_ids:
+            return {}
+        query = f"""
+            SELECT a.local_date, t.tag_type_id, COUNT(*)
+            FROM appointments a
+            JOIN job_tags t ON t.job_id = a.job_id
+            WHERE a.local_date IN ({','.join('?' * len(local_dates))})
+              AND t.tag_type_id IN ({','.join('?' * len(tag_type_ids))})
+            GROUP BY a.local_date, t.tag_type_id
+        """
+        return {(row[0], row[1]): row[2] for row in self._connection().execute(query, local_dates + tag_type_ids)}
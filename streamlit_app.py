@@ -1,22 +1,85 @@
 import streamlit as st
 import datetime
-import requests
-import time
-from dateutil import parser
+import functools
 from pytz import timezone
-from streamlit_autorefresh import st_autorefresh
 from datetime import time as dtt
+import numpy as np
+
+import cache
+import cards
+import push
+import ratelimit
+import servicetitan
+import shared_snapshot
+import snapshot
+import snapshot_api
+import tag_matrix
+import telemetry
+import tenants
+import timestamps
+import store
+import sync
 
 # Arizona Timezone
 arizona_tz = timezone('America/Phoenix')
-now_arizona = datetime.datetime.now(arizona_tz)
 
-# OAuth2 Configuration
-client_id = st.secrets["client_id"]
-client_secret = st.secrets["client_secret"]
-tenant = st.secrets["tenant"]
-st_app_key = st.secrets["st_app_key"]
-token_url = 'https://auth.servicetitan.io/connect/token'
+# OAuth2 Configuration (credentials are per tenant, see TENANTS below)
+token_url = st.secrets.get("token_url", 'https://auth.servicetitan.io/connect/token')
+
+# API host; overridable so the app can run against a sandbox or a local stand-in
+api_base_url = st.secrets.get("api_base_url", 'https://api.servicetitan.io').rstrip('/')
+
+# Number of business days shown on the board (today plus the following weekdays)
+business_days = int(st.secrets.get("business_days", 3))
+
+# Appointments requested per page, and whether to prefetch the next page while counting the current one
+appointments_page_size = int(st.secrets.get("appointments_page_size", servicetitan.DEFAULT_PAGE_SIZE))
+prefetch_next_page = bool(st.secrets.get("prefetch_next_page", True))
+
+# Concurrent requests used to fetch job details in chunks
+job_fetch_workers = int(st.secrets.get("job_fetch_workers", servicetitan.DEFAULT_MAX_WORKERS))
+
+# Size and per-entry TTL of the job detail cache
+job_cache_size = int(st.secrets.get("job_cache_size", 5000))
+job_cache_ttl_seconds = int(st.secrets.get("job_cache_ttl_seconds", 600))
+
+# Refresh with modified-since deltas, plus a periodic full resync of the whole window as a safety net
+delta_sync_enabled = bool(st.secrets.get("delta_sync", True))
+full_resync_interval_seconds = int(st.secrets.get("full_resync_interval_seconds", 3600))
+
+# Stale-while-revalidate: how long a cold start waits for the first snapshot, and how
+# often it checks back until one is ready
+first_render_wait_seconds = float(st.secrets.get("first_render_wait_seconds", 2))
+swap_check_interval_seconds = int(st.secrets.get("swap_check_interval_seconds", 5))
+
+# How often the metrics grid and the Last Updated label redraw themselves (fragment reruns)
+metrics_refresh_seconds = int(st.secrets.get("metrics_refresh_seconds", 300))
+last_updated_refresh_seconds = int(st.secrets.get("last_updated_refresh_seconds", 60))
+
+# How often the shared background poller rebuilds the metrics snapshot
+poll_interval_seconds = int(st.secrets.get("poll_interval_seconds", 300))
+
+# With the shared_snapshot_path secret, replicas on one host share their snapshots through that file:
+# the replica holding its lock polls ServiceTitan and the others re-read what it writes this often
+follow_interval_seconds = int(st.secrets.get("follow_interval_seconds", 5))
+
+# How many tenant snapshots the background poller builds at the same time
+poll_workers = int(st.secrets.get("poll_workers", 4))
+
+# Read-only JSON endpoint for wall TVs and other tools (port 0 turns it off)
+snapshot_api_host = st.secrets.get("snapshot_api_host", "0.0.0.0")
+snapshot_api_port = int(st.secrets.get("snapshot_api_port", 8502))
+
+# Request budgets per endpoint family (auth, jpm, dispatch, default) as [requests per second, burst].
+# Each tenant has its own budget, shared by every worker process on the host through its state files
+rate_limits = {family: tuple(budget) for family, budget in st.secrets.get("rate_limits", {}).items()}
+
+# Local Prometheus endpoint for the phase timings and API counters (port 0 turns it off)
+metrics_host = st.secrets.get("metrics_host", "127.0.0.1")
+metrics_port = int(st.secrets.get("metrics_port", 9108))
+
+# Push a metrics grid rerun to every open session when the snapshot changes, instead of timed reruns
+server_push = bool(st.secrets.get("server_push", True))
 
 st.set_page_config(layout="wide")
 
@@ -32,8 +95,8 @@ def is_within_work_hours():
 
 
 
-# Parameterized tagTypeIds for Op levels
-TAG_TYPE_IDS = {
+# Parameterized tagTypeIds for Op levels (the tag_type_ids secret, or a tenant's own table, can add or override tracked tags)
+DEFAULT_TAG_TYPE_IDS = {
     "L1_No_Op": 74799391,  # "L1 No Op"
     "L2_No_Op": 74798752,  # "L2 No Op"
     "L3_No_Op": 74796076,   # "L3 No Op"
@@ -43,125 +106,261 @@ TAG_TYPE_IDS = {
     "L3_Op": 74796077   # "L3  Op"
 }
 
+# Add targets for Op and No Op metrics
+DEFAULT_TARGETS = {
+    "L1_No_Op": 3,
+    "L2_No_Op": 2,
+    "L3_No_Op": 1,
+    "L1_Op": 9,
+    "L2_Op": 6,
+    "L3_Op": 2
+}
 
+# Tenants served by this process: one per [tenants.<key>] secrets table, or the single
+# tenant described by the top-level secrets. Sessions pick one with ?tenant=<key>.
+TENANTS = tenants.load_tenants(st.secrets, DEFAULT_TAG_TYPE_IDS, DEFAULT_TARGETS,
+                               default_store_path="aq_dashboard.db",
+                               default_rate_limit_state_path="aq_dashboard.ratelimit")
+
+# Function to resolve a requested tenant key (None: the first tenant); raises KeyError for unknown tenants
+def get_tenant_key(requested=None):
+    if requested is None:
+        return next(iter(TENANTS))
+    if requested not in TENANTS:
+        raise KeyError(requested)
+    return requested
+
+# Process-wide timings and counters, served in Prometheus format on the local metrics endpoint
+@st.cache_resource
+def get_metrics():
+    metrics = telemetry.Metrics()
+    metrics.describe("phase_seconds", "Time spent in each phase of a snapshot build and render")
+    metrics.describe("api_request_seconds", "ServiceTitan API request latency by endpoint family")
+    metrics.describe("api_requests_total", "ServiceTitan API responses by endpoint family and status")
+    metrics.describe("api_retries_total", "ServiceTitan API retries by endpoint family and reason")
+    metrics.describe("api_response_bytes_total", "Decoded ServiceTitan API response bytes by endpoint family")
+    metrics.describe("rate_limit_wait_seconds_total", "Seconds API calls waited for their family's budget")
+    if metrics_port:
+        telemetry.MetricsEndpoint(metrics, host=metrics_host, port=metrics_port).start()
+    return metrics
+
+METRICS = get_metrics()
 
 # Function to get OAuth2 token
-def get_oauth_token(client_id, client_secret, token_url):
+def get_oauth_token(client_id, client_secret, token_url, rate_limiter=None):
     data = {
         'grant_type': 'client_credentials',
         'client_id': client_id,
         'client_secret': client_secret
     }
-    
-    response = requests.post(token_url, data=data)
+
+    response = get_api_client().post(token_url, data=data, rate_limiter=rate_limiter)
     response.raise_for_status()  # Check if the request was successful
     token_data = response.json()
     return token_data['access_token'], token_data['expires_in']
 
-# Function to get the cached token or request a new one
-def get_cached_token():
-    if "token" in st.session_state and "token_expiration" in st.session_state:
-        if time.time() < st.session_state.token_expiration:
-            return st.session_state.token
-    
-    token, expires_in = get_oauth_token(client_id, client_secret, token_url)
-    st.session_state.token = token
-    st.session_state.token_expiration = time.time() + expires_in - 60
-    return token
-
-# Function to fetch appointments from API for a specific day
-def fetch_appointments_by_day(start_datetime_utc, end_datetime_utc):
-    appointmentList_url = f'https://api.servicetitan.io/jpm/v2/tenant/{tenant}/appointments?startsOnOrAfter={start_datetime_utc}&startsBefore={end_datetime_utc}'
-    token = get_cached_token()
-    headers = {
-        'Authorization': f'Bearer {token}',
-        'ST-App-Key': st_app_key
-    }
-    response = requests.get(appointmentList_url, headers=headers)
-    response.raise_for_status()
-    appointments_data = response.json()
-    
-    if 'data' not in appointments_data or not appointments_data.get('data', []):
-        #st.write(f"No appointments found for {start_datetime_utc} to {end_datetime_utc}")
-        return []
-    
-    
-    return appointments_data.get('data', [])
+# Host-wide request budgets a tenant's API calls draw from
+@st.cache_resource
+def get_rate_limiter(tenant_key):
+    limiter = ratelimit.TokenBucketLimiter(rate_limits, state_path=TENANTS[tenant_key].rate_limit_state_path or None)
+    METRICS.register("rate_limit_available_tokens", "gauge", "Requests currently left in each family's budget",
+                     lambda: {(("family", family),): usage["available"] for family, usage in limiter.usage().items()},
+                     tenant=tenant_key)
+    return limiter
+
+# Process-wide HTTP client: one keep-alive connection pool with retry/backoff for every API call of every tenant
+@st.cache_resource
+def get_api_client():
+    return servicetitan.ApiClient(
+        pool_size=int(st.secrets.get("http_pool_size", 20)),
+        connect_timeout=float(st.secrets.get("http_connect_timeout", 5)),
+        read_timeout=float(st.secrets.get("http_read_timeout", 30)),
+        max_retries=int(st.secrets.get("http_max_retries", 4)),
+        metrics=METRICS)
+
+# Token manager per tenant, shared by every session (and persisted to disk when token_cache_path is set)
+@st.cache_resource
+def get_token_manager(tenant_key):
+    config = TENANTS[tenant_key]
+    return servicetitan.TokenManager(
+        lambda: get_oauth_token(config.client_id, config.client_secret, token_url, get_rate_limiter(tenant_key)),
+        cache_path=config.token_cache_path,
+        cache_key=f"{token_url}|{config.client_id}")
 
-# Function to fetch job details using bulk job IDs (up to 50 at a time)
-def fetch_job_details_bulk(job_ids):
-    if not job_ids:
-        st.write("No job IDs to fetch.")
-        return {}
+# Function to get the cached token or request a new one
+@METRICS.timed("token")
+def get_cached_token(tenant_key):
+    return get_token_manager(tenant_key).get_token()
 
-    job_url = f'https://api.servicetitan.io/jpm/v2/tenant/{tenant}/jobs?ids={",".join(job_ids)}'
-    token = get_cached_token()
+# Function to GET an API URL for a tenant (its token, app key and request budget) and decode the JSON body
+def get_api_json(tenant_key, url):
+    token = get_cached_token(tenant_key)
     headers = {
         'Authorization': f'Bearer {token}',
-        'ST-App-Key': st_app_key
+        'ST-App-Key': TENANTS[tenant_key].st_app_key
     }
-    
-    response = requests.get(job_url, headers=headers)
+    response = get_api_client().get(url, headers=headers, rate_limiter=get_rate_limiter(tenant_key))
     response.raise_for_status()
-    job_details_data = response.json()
-
-    
+    return response.json()
+
+# Function to fetch one page of appointments from the API
+def fetch_appointments_page(tenant_key, start_datetime_utc, end_datetime_utc, page, page_size):
+    appointmentList_url = f'{api_base_url}/jpm/v2/tenant/{TENANTS[tenant_key].tenant}/appointments?startsOnOrAfter={start_datetime_utc}&startsBefore={end_datetime_utc}&page={page}&pageSize={page_size}'
+    return get_api_json(tenant_key, appointmentList_url)
+
+# Function to stream appointments from the API page by page (follows hasMore)
+def fetch_appointments_by_day(tenant_key, start_datetime_utc, end_datetime_utc):
+    return METRICS.timed_iter("fetch_appointments", servicetitan.iter_pages(
+        lambda page, page_size: fetch_appointments_page(tenant_key, start_datetime_utc, end_datetime_utc, page, page_size),
+        page_size=appointments_page_size, prefetch=prefetch_next_page))
+
+# Function to fetch one page of appointments modified since a UTC timestamp (any start date)
+def fetch_modified_appointments_page(tenant_key, modified_since_utc, page, page_size):
+    appointmentList_url = f'{api_base_url}/jpm/v2/tenant/{TENANTS[tenant_key].tenant}/appointments?modifiedOnOrAfter={modified_since_utc}&page={page}&pageSize={page_size}'
+    return get_api_json(tenant_key, appointmentList_url)
+
+# Function to stream appointments modified since a UTC timestamp page by page
+def fetch_modified_appointments(tenant_key, modified_since_utc):
+    return servicetitan.iter_pages(
+        lambda page, page_size: fetch_modified_appointments_page(tenant_key, modified_since_utc, page, page_size),
+        page_size=appointments_page_size, prefetch=prefetch_next_page)
+
+# Function to fetch one page of jobs modified since a UTC timestamp
+def fetch_modified_jobs_page(tenant_key, modified_since_utc, page, page_size):
+    job_url = f'{api_base_url}/jpm/v2/tenant/{TENANTS[tenant_key].tenant}/jobs?modifiedOnOrAfter={modified_since_utc}&page={page}&pageSize={page_size}'
+    return get_api_json(tenant_key, job_url)
+
+# Function to stream jobs modified since a UTC timestamp page by page (refreshing the job cache as it goes)
+def fetch_modified_jobs(tenant_key, modified_since_utc):
+    for jobs in servicetitan.iter_pages(
+            lambda page, page_size: fetch_modified_jobs_page(tenant_key, modified_since_utc, page, page_size),
+            page_size=appointments_page_size, prefetch=prefetch_next_page):
+        get_job_cache(tenant_key).put_many((job['id'], job) for job in jobs)
+        yield jobs
+
+# Function to fetch job details for one chunk of job IDs (up to 50 at a time)
+def fetch_job_details_chunk(tenant_key, job_ids):
+    job_url = f'{api_base_url}/jpm/v2/tenant/{TENANTS[tenant_key].tenant}/jobs?ids={",".join(job_ids)}&pageSize={len(job_ids)}'
+    job_details_data = get_api_json(tenant_key, job_url)
     return {job['id']: job for job in job_details_data.get('data', [])}
 
-# Function to process appointments for a given day
-def process_appointments_by_day(start_datetime_utc, end_datetime_utc):
-    appointments = fetch_appointments_by_day(start_datetime_utc, end_datetime_utc)
-    
-    if not appointments:
-        return (0, 0, 0, 0, 0, 0)  # Return zeros if no appointments
-
-    # Get job IDs from the appointments (max 50)
-    job_ids = [str(appointment['jobId']) for appointment in appointments[:50]]
-    
-    # Fetch job details for those job IDs in bulk
-    job_details_dict = fetch_job_details_bulk(job_ids)
-
-
-
-    # Initialize metric counts for Op and No Op
-    metric_L1_No_Op = 0
-    metric_L2_No_Op = 0
-    metric_L3_No_Op = 0
-    metric_L1_Op = 0
-    metric_L2_Op = 0
-    metric_L3_Op = 0
-
-    # Process each appointment and update the Op/No Op metrics
-    for appointment in appointments:
-        job_id = appointment['jobId']
-        job_details = job_details_dict.get(job_id, {})
-
-        if TAG_TYPE_IDS["L1_No_Op"] in job_details.get('tagTypeIds', []):
-            metric_L1_No_Op += 1
-
-        if TAG_TYPE_IDS["L2_No_Op"] in job_details.get('tagTypeIds', []):
-            metric_L2_No_Op += 1
-
-        if TAG_TYPE_IDS["L3_No_Op"] in job_details.get('tagTypeIds', []):
-            metric_L3_No_Op += 1
-
-        if TAG_TYPE_IDS["L1_Op"] in job_details.get('tagTypeIds', []):
-            metric_L1_Op += 1
-
-        if TAG_TYPE_IDS["L2_Op"] in job_details.get('tagTypeIds', []):
-            metric_L2_Op += 1
-
-        if TAG_TYPE_IDS["L3_Op"] in job_details.get('tagTypeIds', []):
-            metric_L3_Op += 1
-
-    return (metric_L1_No_Op, metric_L2_No_Op, metric_L3_No_Op,
-            metric_L1_Op, metric_L2_Op, metric_L3_Op)
+# Job cache per tenant (LRU by size, TTL per entry) in front of the job endpoint
+@st.cache_resource
+def get_job_cache(tenant_key):
+    job_cache = cache.LRUTTLCache(max_entries=job_cache_size, ttl=job_cache_ttl_seconds)
+    METRICS.register("job_cache_hits_total", "counter", "Job detail cache hits", lambda: job_cache.hits,
+                     tenant=tenant_key)
+    METRICS.register("job_cache_misses_total", "counter", "Job detail cache misses", lambda: job_cache.misses,
+                     tenant=tenant_key)
+    METRICS.register("job_cache_evictions_total", "counter", "Job detail cache LRU evictions",
+                     lambda: job_cache.evictions, tenant=tenant_key)
+    METRICS.register("job_cache_entries", "gauge", "Job detail cache entries", lambda: len(job_cache),
+                     tenant=tenant_key)
+    return job_cache
+
+# Function to fetch job details for any number of job IDs; only missing or expired
+# IDs go to the API, chunked and fetched concurrently
+@METRICS.timed("fetch_job_details")
+def fetch_job_details_bulk(tenant_key, job_ids):
+    job_cache = get_job_cache(tenant_key)
+    job_details_dict, missing_ids = job_cache.get_many([int(job_id) for job_id in job_ids])
+    if missing_ids:
+        fetched = servicetitan.fetch_by_ids(
+            functools.partial(fetch_job_details_chunk, tenant_key), [str(job_id) for job_id in missing_ids],
+            max_workers=job_fetch_workers)
+        job_cache.put_many(fetched.items())
+        job_details_dict.update(fetched)
+    return job_details_dict
+
+# Tag-membership matrix over a tenant's tracked tags, used for all counting
+@st.cache_resource
+def get_tag_matrix(tenant_key):
+    return tag_matrix.TagMatrix(TENANTS[tenant_key].tag_type_ids)
+
+# Function to count the tracked tags for a batch of appointments, per day, in one vectorized
+# pass over the tag matrix (rows: appointments, columns: the tenant's tags). Appointments outside
+# the days (e.g. weekends in the range) or no longer live are left out.
+def count_appointment_metrics(tenant_key, appointments, job_details_dict, days):
+    day_positions = {day: position for position, day in enumerate(days)}
+    local_dates = timestamps.local_dates([appointment['start'] for appointment in appointments], arizona_tz).tolist()
+    day_indexes = [
+        day_positions.get(local_date, -1) if sync.is_live_appointment(appointment) else -1
+        for appointment, local_date in zip(appointments, local_dates)
+    ]
+    return get_tag_matrix(tenant_key).count(appointments, job_details_dict, day_indexes, len(days))
+
+# SQLite store of a tenant's synced working set (None when its store_path is empty)
+@st.cache_resource
+def get_store(tenant_key):
+    store_path = TENANTS[tenant_key].store_path
+    if not store_path:
+        return None
+    return store.Store(store_path, local_date=lambda start: get_local_date(start).isoformat())
+
+# Delta sync engine per tenant, holding its working set of appointments and jobs
+@st.cache_resource
+def get_sync_engine(tenant_key):
+    return sync.SyncEngine(
+        functools.partial(fetch_appointments_by_day, tenant_key),
+        functools.partial(fetch_modified_appointments, tenant_key),
+        functools.partial(fetch_job_details_bulk, tenant_key),
+        functools.partial(fetch_modified_jobs, tenant_key),
+        full_resync_interval=full_resync_interval_seconds, store=get_store(tenant_key))
+
+# Function to count per-day metrics for the days from the store with one indexed query
+def count_stored_metrics(tenant_key, days):
+    tag_type_ids = TENANTS[tenant_key].tag_type_ids.values()
+    tag_counts = get_store(tenant_key).count_tags([day.isoformat() for day in days], tag_type_ids)
+    return {day: tuple(tag_counts.get((day.isoformat(), tag_type_id), 0) for tag_type_id in tag_type_ids)
+            for day in days}
+
+# Function to count per-day metrics from the delta-synced working set
+def process_synced_appointments(tenant_key, days, range_start_utc, range_end_utc):
+    engine = get_sync_engine(tenant_key)
+    engine.sync(format_datetime(range_start_utc), format_datetime(range_end_utc))
+
+    if engine.store is not None:
+        return count_stored_metrics(tenant_key, days)
+
+    counts = count_appointment_metrics(tenant_key, list(engine.appointments.values()), engine.jobs, days)
+    return {day: tuple(int(count) for count in counts[position]) for position, day in enumerate(days)}
+
+# Function to process appointments for every day in the horizon with a single range query
+@METRICS.timed("process_appointments")
+def process_appointments_by_day(tenant_key, days):
+    range_start_utc = convert_to_utc(get_day_start_az(days[0]))
+    range_end_utc = convert_to_utc(get_day_start_az(days[-1] + datetime.timedelta(days=1)))
+
+    if delta_sync_enabled:
+        return process_synced_appointments(tenant_key, days, range_start_utc, range_end_utc)
+
+    # Running totals per day; each page is counted and then dropped so memory stays flat
+    totals = np.zeros((len(days), len(TENANTS[tenant_key].tag_type_ids)), dtype=np.int64)
+
+    for appointments in fetch_appointments_by_day(tenant_key, format_datetime(range_start_utc), format_datetime(range_end_utc)):
+        # Get job IDs from the page's appointments
+        job_ids = [str(appointment['jobId']) for appointment in appointments]
+
+        # Fetch job details for those job IDs in concurrent chunks
+        job_details_dict = fetch_job_details_bulk(tenant_key, job_ids)
+
+        totals += count_appointment_metrics(tenant_key, appointments, job_details_dict, days)
+
+    return {day: tuple(int(count) for count in totals[position]) for position, day in enumerate(days)}
 
 # Convert Arizona time to UTC time
 def convert_to_utc(dt_arizona):
     dt_utc = dt_arizona.astimezone(datetime.timezone.utc)
     return dt_utc
 
+# Function to get midnight of a date in Arizona time (localize picks up MST, not pytz's LMT)
+def get_day_start_az(day):
+    return arizona_tz.localize(datetime.datetime.combine(day, datetime.time(0, 0)))
+
+# Function to get the local Arizona date of an API timestamp
+def get_local_date(timestamp):
+    return timestamps.local_date(timestamp, arizona_tz)
+
 # Function to format datetime for API
 def format_datetime(dt):
     return dt.strftime('%Y-%m-%dT%H:%M:%SZ')
@@ -175,10 +374,10 @@ def get_next_weekday(current_day, days_ahead):
             days_ahead -= 1
     return target_day
 
+# Function to get today plus the following weekdays, `count` days in total
+def get_business_days(current_day, count):
+    return [current_day] + [get_next_weekday(current_day, days_ahead) for days_ahead in range(1, count)]
 
-# Determine colors for delta (red for negative, green for positive or zero)
-def get_delta_color(delta):
-    return "negative" if delta < 0 else "positive"
 
 # Celebrate function
 def celebrate(message):
@@ -189,16 +388,17 @@ def celebrate(message):
 # Helper function to reset session state at the start of a new Arizona day
 def reset_celebration_state_if_needed():
     #st.session_state.clear()
-    if "last_celebration_reset" not in st.session_state or st.session_state.last_celebration_reset != now_arizona.date():
+    today_arizona = datetime.datetime.now(arizona_tz).date()
+    if "last_celebration_reset" not in st.session_state or st.session_state.last_celebration_reset != today_arizona:
         st.session_state.clear()
-        st.session_state.last_celebration_reset = now_arizona.date()
+        st.session_state.last_celebration_reset = today_arizona
 
 # Function to track if we've already celebrated
 def check_and_celebrate(target_name, metric, target, day_name, level):
     if target_name not in st.session_state:
         st.session_state[target_name] = False
     
-    current_day_name = now_arizona.strftime("%A")
+    current_day_name = datetime.datetime.now(arizona_tz).strftime("%A")
 
     if not st.session_state[target_name] and metric >= target:
         if current_day_name == day_name:
@@ -212,115 +412,210 @@ def check_and_celebrate(target_name, metric, target, day_name, level):
 
 reset_celebration_state_if_needed()
 
-# Get today's date and calculate the next two weekdays
-today = datetime.date.today()
-next_day = get_next_weekday(today, 1)
-third_day = get_next_weekday(today, 2)
-
-# Define the start and end datetime for each day in Arizona time
-today_start_az = datetime.datetime.combine(today, datetime.time(0, 0)).replace(tzinfo=arizona_tz)
-today_end_az = datetime.datetime.combine(today, datetime.time(23, 59)).replace(tzinfo=arizona_tz)
-
-next_day_start_az = datetime.datetime.combine(next_day, datetime.time(0, 0)).replace(tzinfo=arizona_tz)
-next_day_end_az = datetime.datetime.combine(next_day, datetime.time(23, 59)).replace(tzinfo=arizona_tz)
-
-third_day_start_az = datetime.datetime.combine(third_day, datetime.time(0, 0)).replace(tzinfo=arizona_tz)
-third_day_end_az = datetime.datetime.combine(third_day, datetime.time(23, 59)).replace(tzinfo=arizona_tz)
+# Build a tenant's per-day metrics for the business-day horizon (runs on the scheduler thread)
+def build_metrics_snapshot(tenant_key):
+    days = get_business_days(datetime.datetime.now(arizona_tz).date(), business_days)
+    metrics_by_day = process_appointments_by_day(tenant_key, days)
+    tag_keys = TENANTS[tenant_key].tag_type_ids
+    return [snapshot.DayMetrics(date=day, counts=dict(zip(tag_keys, metrics_by_day[day]))) for day in days]
+
+# Build a tenant's first snapshot straight from its on-disk store, before any API call
+def seed_metrics_snapshot(tenant_key):
+    engine = get_sync_engine(tenant_key)
+    if engine.store is None or engine.store.get_state('last_sync') is None:
+        return None
+    days = get_business_days(datetime.datetime.now(arizona_tz).date(), business_days)
+    metrics_by_day = count_stored_metrics(tenant_key, days)
+    tag_keys = TENANTS[tenant_key].tag_type_ids
+    day_metrics = [snapshot.DayMetrics(date=day, counts=dict(zip(tag_keys, metrics_by_day[day]))) for day in days]
+    return day_metrics, engine.store.get_state('last_sync')
+
+# Sessions to rerun when a tenant's snapshot changes (shared by all its sessions in this server process)
+@st.cache_resource
+def get_session_notifier(tenant_key):
+    return push.SessionNotifier()
+
+# One scheduler per server process drives every tenant's poller, building up to poll_workers tenants at once
+@st.cache_resource
+def get_poll_scheduler():
+    return snapshot.PollScheduler(name="metrics-snapshot-scheduler", max_workers=poll_workers)
+
+# One poller per tenant; every session of that tenant reads the snapshot it publishes
+# (built here, or by the leading replica when the snapshot is shared)
+@st.cache_resource
+def get_snapshot_poller(tenant_key):
+    shared_path = TENANTS[tenant_key].shared_snapshot_path
+    poller = snapshot.SnapshotPoller(
+        functools.partial(build_metrics_snapshot, tenant_key), interval=poll_interval_seconds,
+        should_poll=is_within_work_hours,
+        seed=functools.partial(seed_metrics_snapshot, tenant_key) if delta_sync_enabled else None,
+        name=f"metrics-snapshot-{tenant_key}",
+        shared=shared_snapshot.SharedSnapshot(shared_path) if shared_path else None,
+        follow_interval=follow_interval_seconds)
+    notifier = get_session_notifier(tenant_key)
+    poller.subscribe(lambda metrics_snapshot: notifier.notify())
+    METRICS.register("snapshot_version", "gauge", "Version of the published metrics snapshot",
+                     lambda: metrics_snapshot.version if (metrics_snapshot := poller.peek()) else 0, tenant=tenant_key)
+    METRICS.register("snapshot_age_seconds", "gauge", "Age of the published metrics snapshot",
+                     lambda: round(metrics_snapshot.age(), 3) if (metrics_snapshot := poller.peek()) else -1,
+                     tenant=tenant_key)
+    METRICS.register("snapshot_leader", "gauge", "1 if this replica builds the snapshot, 0 if it follows another",
+                     lambda: int(poller.leading), tenant=tenant_key)
+    return poller.start(get_poll_scheduler())
+
+# Function to describe how old the snapshot is ("just now", "4 min ago", "2 h ago")
+def format_age(seconds):
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min ago"
+    return f"{int(seconds // 3600)} h ago"
+
+# Function to get the days to show from a snapshot (zeroed cards for the horizon when it has none)
+def get_day_metrics(tenant_key, metrics_snapshot):
+    if metrics_snapshot is not None and metrics_snapshot.days:
+        return list(metrics_snapshot.days)
+    return [snapshot.DayMetrics(date=day, counts=dict.fromkeys(TENANTS[tenant_key].tag_type_ids, 0))
+            for day in get_business_days(datetime.datetime.now(arizona_tz).date(), business_days)]
+
+
+# Get the card title for a day ("Today", the weekday name, or the date once names repeat)
+def get_day_title(day):
+    today = datetime.datetime.now(arizona_tz).date()
+    if day == today:
+        return "Today"
+    if (day - today).days < 7:
+        return day.strftime("%A")
+    return day.strftime("%a %b %d")
+
+
+# Card renderer per tenant for the levels that have Op / No Op tags and targets (template compiled once per process)
+@st.cache_resource
+def get_card_renderer(tenant_key):
+    config = TENANTS[tenant_key]
+    return cards.CardRenderer(cards.get_levels(config.tag_type_ids, config.targets), config.targets)
+
+# Build the HTML card for one day
+def render_day_card(card_renderer, metrics):
+    return card_renderer.render(get_day_title(metrics.date), metrics.counts)
+
+
+# Function to describe a tenant's snapshot for the JSON endpoint: per-day counts with their targets and deltas
+def snapshot_to_json(tenant_key, metrics_snapshot):
+    targets = TENANTS[get_tenant_key(tenant_key)].targets
+    return {
+        "version": metrics_snapshot.version,
+        "built_at": datetime.datetime.fromtimestamp(metrics_snapshot.built_at, arizona_tz).isoformat(),
+        "error": metrics_snapshot.error,
+        "days": [
+            {
+                "date": metrics.date.isoformat(),
+                "name": metrics.name,
+                "metrics": {
+                    key: {"count": int(count), "target": targets.get(key), "delta": targets[key] - int(count) if key in targets else None}
+                    for key, count in metrics.counts.items()
+                },
+            }
+            for metrics in metrics_snapshot.days
+        ],
+    }
 
-# Convert Arizona time to UTC time for the API
-today_start_utc = convert_to_utc(today_start_az)
-today_end_utc = convert_to_utc(today_end_az)
+# One JSON endpoint per server process, reading the same snapshots as the UI (?tenant=<key>, default the first)
+@st.cache_resource
+def get_snapshot_endpoint():
+    if not snapshot_api_port:
+        return None
+    pollers = {tenant_key: get_snapshot_poller(tenant_key) for tenant_key in TENANTS}
+    return snapshot_api.SnapshotEndpoint(
+        lambda tenant_key: pollers[get_tenant_key(tenant_key)].peek(), snapshot_to_json,
+        host=snapshot_api_host, port=snapshot_api_port, key_param="tenant").start()
 
-next_day_start_utc = convert_to_utc(next_day_start_az)
-next_day_end_utc = convert_to_utc(next_day_end_az)
 
-third_day_start_utc = convert_to_utc(third_day_start_az)
-third_day_end_utc = convert_to_utc(third_day_end_az)
+# Start the shared pollers for every tenant, then pick this session's tenant (?tenant=<key>, default the first)
+for configured_tenant_key in TENANTS:
+    get_snapshot_poller(configured_tenant_key)
+get_snapshot_endpoint()
 
-# Process appointments and job details for each day (for both Op and No Op metrics)
 try:
-    (metric_L1_No_Op_today, metric_L2_No_Op_today, metric_L3_No_Op_today,
-     metric_L1_Op_today, metric_L2_Op_today, metric_L3_Op_today) = process_appointments_by_day(
-        format_datetime(today_start_utc), format_datetime(today_end_utc))
-    
-    (metric_L1_No_Op_next_day, metric_L2_No_Op_next_day, metric_L3_No_Op_next_day,
-     metric_L1_Op_next_day, metric_L2_Op_next_day, metric_L3_Op_next_day) = process_appointments_by_day(
-        format_datetime(next_day_start_utc), format_datetime(next_day_end_utc))
-    
-    (metric_L1_No_Op_third_day, metric_L2_No_Op_third_day, metric_L3_No_Op_third_day,
-     metric_L1_Op_third_day, metric_L2_Op_third_day, metric_L3_Op_third_day) = process_appointments_by_day(
-        format_datetime(third_day_start_utc), format_datetime(third_day_end_utc))
-except requests.RequestException as e:
-    st.error(f"Failed to fetch data: {e}")
-    metric_L1_No_Op_today = metric_L1_No_Op_next_day = metric_L1_No_Op_third_day = 0
-    metric_L2_No_Op_today = metric_L2_No_Op_next_day = metric_L2_No_Op_third_day = 0
-    metric_L3_No_Op_today = metric_L3_No_Op_next_day = metric_L3_No_Op_third_day = 0
-    metric_L1_Op_today = metric_L1_Op_next_day = metric_L1_Op_third_day = 0
-    metric_L2_Op_today = metric_L2_Op_next_day = metric_L2_Op_third_day = 0
-    metric_L3_Op_today = metric_L3_Op_next_day = metric_L3_Op_third_day = 0
-
-
-
-# Add targets for Op and No Op metrics
-target_L1_No_Op = 3
-target_L2_No_Op = 2
-target_L3_No_Op = 1
-target_L1_Op = 9
-target_L2_Op = 6
-target_L3_Op = 2
-
-
-# Calculate deltas for Op and No Op for each day
-delta_L1_No_Op_today = target_L1_No_Op - metric_L1_No_Op_today
-delta_L2_No_Op_today = target_L2_No_Op - metric_L2_No_Op_today
-delta_L3_No_Op_today = target_L3_No_Op - metric_L3_No_Op_today
-delta_L1_Op_today = target_L1_Op - metric_L1_Op_today
-delta_L2_Op_today = target_L2_Op - metric_L2_Op_today
-delta_L3_Op_today = target_L3_Op - metric_L3_Op_today
-
-# Similar for next day and third day...
-# Next day deltas
-delta_L1_No_Op_next_day = target_L1_No_Op - metric_L1_No_Op_next_day
-delta_L2_No_Op_next_day = target_L2_No_Op - metric_L2_No_Op_next_day
-delta_L3_No_Op_next_day = target_L3_No_Op - metric_L3_No_Op_next_day
-delta_L1_Op_next_day = target_L1_Op - metric_L1_Op_next_day
-delta_L2_Op_next_day = target_L2_Op - metric_L2_Op_next_day
-delta_L3_Op_next_day = target_L3_Op - metric_L3_Op_next_day
-
-# Third day deltas
-delta_L1_No_Op_third_day = target_L1_No_Op - metric_L1_No_Op_third_day
-delta_L2_No_Op_third_day = target_L2_No_Op - metric_L2_No_Op_third_day
-delta_L3_No_Op_third_day = target_L3_No_Op - metric_L3_No_Op_third_day
-delta_L1_Op_third_day = target_L1_Op - metric_L1_Op_third_day
-delta_L2_Op_third_day = target_L2_Op - metric_L2_Op_third_day
-delta_L3_Op_third_day = target_L3_Op - metric_L3_Op_third_day
-
-# Get the names of the days
-today_name = today.strftime("%A")
-next_day_name = next_day.strftime("%A")
-third_day_name = third_day.strftime("%A")
-
-
-
-#Do revers order so they show up in order
-
-# Check and celebrate if targets are met (for third day)
-check_and_celebrate("L1 Op Third Day", metric_L1_Op_third_day, target_L1_Op, third_day_name, 1)
-check_and_celebrate("L2 Op Third Day", metric_L2_Op_third_day, target_L2_Op, third_day_name, 2)
-check_and_celebrate("L3 Op Third Day", metric_L3_Op_third_day, target_L3_Op, third_day_name, 3)
-
-# Check and celebrate if targets are met (for next day)
-check_and_celebrate("L1 Op Next Day", metric_L1_Op_next_day, target_L1_Op, next_day_name, 1)
-check_and_celebrate("L2 Op Next Day", metric_L2_Op_next_day, target_L2_Op, next_day_name, 2)
-check_and_celebrate("L3 Op Next Day", metric_L3_Op_next_day, target_L3_Op, next_day_name, 3)
-
-# Check and celebrate if targets are met (for today)
-check_and_celebrate("L1 Op Today", metric_L1_Op_today, target_L1_Op, today_name, 1)
-check_and_celebrate("L2 Op Today", metric_L2_Op_today, target_L2_Op, today_name, 2)
-check_and_celebrate("L3 Op Today", metric_L3_Op_today, target_L3_Op, today_name, 3)
-
-
-
+    tenant_key = get_tenant_key(st.query_params.get("tenant"))
+except KeyError:
+    st.error(f"Unknown tenant {st.query_params.get('tenant')!r}; use one of: {', '.join(TENANTS)}")
+    st.stop()
+tenant_config = TENANTS[tenant_key]
+card_renderer = get_card_renderer(tenant_key)
+
+# A cold start with nothing on disk waits briefly for the first build
+snapshot_poller = get_snapshot_poller(tenant_key)
+initial_snapshot = snapshot_poller.get(timeout=first_render_wait_seconds)
+
+# With server push the grid only reruns when the snapshot version advances; otherwise it polls on a timer
+session_notifier = get_session_notifier(tenant_key)
+push_enabled = server_push and session_notifier.available()
+
+
+# Last Updated label: when the shared snapshot was built, and how long ago. Its own small
+# fragment so the age stays current without redrawing the cards.
+@st.fragment(run_every=last_updated_refresh_seconds)
+def show_last_updated():
+    metrics_snapshot = snapshot_poller.peek()
+    if metrics_snapshot is None:
+        return
+    last_updated = datetime.datetime.fromtimestamp(metrics_snapshot.built_at, arizona_tz)
+    last_updated_age = format_age(metrics_snapshot.age())
+    if snapshot_poller.refreshing:
+        last_updated_age += " · refreshing…"
+    st.markdown(
+        f'<div class="last-updated">Last Updated: {last_updated.strftime("%Y-%m-%d %H:%M:%S")} ({last_updated_age})</div>',
+        unsafe_allow_html=True)
+
+
+# Metrics grid: status message, cards and celebrations, drawn from the last good snapshot
+# while the poller refreshes in the background. Only this fragment reruns, either when the
+# poller pushes a new snapshot version or, without push, on each tick.
+@st.fragment(run_every=(None if push_enabled
+                        else swap_check_interval_seconds if initial_snapshot is None
+                        else metrics_refresh_seconds if is_within_work_hours() else None))
+def show_metrics_grid():
+    if push_enabled:
+        session_notifier.subscribe()
+
+    # Sessions can stay open across midnight without a full rerun
+    reset_celebration_state_if_needed()
+
+    metrics_snapshot = snapshot_poller.peek()
+    if metrics_snapshot is None:
+        st.info("Loading the latest numbers from ServiceTitan…")
+        return
+    if initial_snapshot is None:
+        # The first snapshot just arrived: one full run re-registers the fragments at their normal cadence
+        st.rerun()
+
+    if metrics_snapshot.error and metrics_snapshot.days:
+        st.warning(f"Showing the last good numbers; the latest refresh failed: {metrics_snapshot.error}")
+    elif metrics_snapshot.error:
+        st.error(f"Failed to fetch data: {metrics_snapshot.error}")
+
+    day_metrics = get_day_metrics(tenant_key, metrics_snapshot)
+
+    # Layout using columns, wrapping longer horizons onto several rows
+    cards_per_row = int(st.secrets.get("cards_per_row", min(len(day_metrics), 5)))
+    with METRICS.span("render_cards"):
+        for row_start in range(0, len(day_metrics), cards_per_row):
+            columns = st.columns([2] * cards_per_row)
+            for column, metrics in zip(columns, day_metrics[row_start:row_start + cards_per_row]):
+                with column:
+                    st.markdown(render_day_card(card_renderer, metrics), unsafe_allow_html=True)
+
+    #Do revers order so they show up in order
+
+    # Check and celebrate if Op targets are met for each day
+    for metrics in reversed(day_metrics):
+        for level in card_renderer.levels:
+            check_and_celebrate(f"{tenant_key} L{level} Op {metrics.date.isoformat()}", metrics.counts[f"L{level}_Op"],
+                                tenant_config.targets[f"L{level}_Op"], get_day_title(metrics.date), level)
+
+
+# Static layout, sent once per session; the fragments above fill in the changing parts
 # Custom CSS for a horizontal metric layout and card styling
 st.markdown("""
     <style>
@@ -408,105 +703,37 @@ st.markdown("""
 
     </style>
 """, unsafe_allow_html=True)
-
-
-# Layout with title and Last Updated message
+# Layout with title and Last Updated message (the tenant's name when this process serves several)
 col1, col2 = st.columns([4, 6])
 with col1:
-    st.markdown('<div class="title">🎈 3 Day Schedule</div>', unsafe_allow_html=True)
+    board_title = f"{tenant_config.name} · {business_days} Day Schedule" if len(TENANTS) > 1 else f"{business_days} Day Schedule"
+    st.markdown(f'<div class="title">🎈 {board_title}</div>', unsafe_allow_html=True)
 with col2:
-    st.markdown(f'<div class="last-updated">Last Updated: {now_arizona.strftime("%Y-%m-%d %H:%M:%S")}</div>', unsafe_allow_html=True)
+    show_last_updated()
+
+show_metrics_grid()
+
+
+# Hidden debug panel (add ?debug=1 to the URL) with phase timings and cache counters for tuning
+if st.query_params.get("debug"):
+    with st.expander("Debug"):
+        telemetry_summary = METRICS.summary()
+        st.write("Phase timings")
+        st.table([{"phase": phase, **timing} for phase, timing in sorted(telemetry_summary["phases"].items())])
+        st.write("Counters")
+        st.json(telemetry_summary["counters"])
+        st.write("Job cache")
+        st.json(get_job_cache(tenant_key).stats())
+        st.write("API budgets")
+        st.table([{"family": family, **usage} for family, usage in get_rate_limiter(tenant_key).usage().items()])
+        st.write("Card renderer")
+        st.json(card_renderer.stats())
+        st.write("Snapshot push")
+        st.json({'tenant': tenant_key, 'leading': snapshot_poller.leading, 'enabled': push_enabled, 'subscribed_sessions': len(session_notifier),
+                 'snapshot_version': snapshot_poller.peek().version if snapshot_poller.peek() else None})
 
-# Layout using columns
-col1, col2, col3 = st.columns([2, 2, 2])
 
-# First column: Today
-with col1:
-    st.markdown(f"""
-        <div class="card">Today
-            <div class="metric-container ">
-                <div class="label-header">Level</div>
-                <div class="metric-header">Op</div>
-                <div class="metric-header">No Op</div>
-            </div>
-            <div class="metric-container">
-                <div class="metric-label">Level 1</div>
-                <div class="metric-value">{metric_L1_Op_today}<span class="metric-delta {get_delta_color(delta_L1_Op_today)}">{delta_L1_Op_today}</span></div>
-                <div class="metric-value">{metric_L1_No_Op_today}<span class="metric-delta {get_delta_color(delta_L1_No_Op_today)}">{delta_L1_No_Op_today}</span></div>
-            </div>
-            <div class="metric-container">
-                <div class="metric-label">Level 2</div>
-                <div class="metric-value">{metric_L2_Op_today}<span class="metric-delta {get_delta_color(delta_L2_Op_today)}">{delta_L2_Op_today}</span></div>
-                <div class="metric-value">{metric_L2_No_Op_today}<span class="metric-delta {get_delta_color(delta_L2_No_Op_today)}">{delta_L2_No_Op_today}</span></div>
-            </div>
-            <div class="metric-container">
-                <div class="metric-label">Level 3</div>
-                <div class="metric-value">{metric_L3_Op_today}<span class="metric-delta {get_delta_color(delta_L3_Op_today)}">{delta_L3_Op_today}</span></div>
-                <div class="metric-value">{metric_L3_No_Op_today}<span class="metric-delta {get_delta_color(delta_L3_No_Op_today)}">{delta_L3_No_Op_today}</span></div>
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
-
-# Second column: Next Day
-with col2:
-    st.markdown(f"""
-        <div class="card">{next_day_name}
-            <div class="metric-container ">
-                <div class="label-header">Level</div>
-                <div class="metric-header">Op</div>
-                <div class="metric-header">No Op</div>
-            </div>
-            <div class="metric-container">
-                <div class="metric-label">Level 1</div>
-                <div class="metric-value">{metric_L1_Op_next_day}<span class="metric-delta {get_delta_color(delta_L1_Op_next_day)}">{delta_L1_Op_next_day}</span></div>
-                <div class="metric-value">{metric_L1_No_Op_next_day}<span class="metric-delta {get_delta_color(delta_L1_No_Op_next_day)}">{delta_L1_No_Op_next_day}</span></div>
-            </div>
-            <div class="metric-container">
-                <div class="metric-label">Level 2</div>
-                <div class="metric-value">{metric_L2_Op_next_day}<span class="metric-delta {get_delta_color(delta_L2_Op_next_day)}">{delta_L2_Op_next_day}</span></div>
-                <div class="metric-value">{metric_L2_No_Op_next_day}<span class="metric-delta {get_delta_color(delta_L2_No_Op_next_day)}">{delta_L2_No_Op_next_day}</span></div>
-            </div>
-            <div class="metric-container">
-                <div class="metric-label">Level 3</div>
-                <div class="metric-value">{metric_L3_Op_next_day}<span class="metric-delta {get_delta_color(delta_L3_Op_next_day)}">{delta_L3_Op_next_day}</span></div>
-                <div class="metric-value">{metric_L3_No_Op_next_day}<span class="metric-delta {get_delta_color(delta_L3_No_Op_next_day)}">{delta_L3_No_Op_next_day}</span></div>
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
-
-# Third column: Third Day
-with col3:
-    st.markdown(f"""
-        <div class="card">{third_day_name}
-            <div class="metric-container ">
-                <div class="label-header">Level</div>
-                <div class="metric-header">Op</div>
-                <div class="metric-header">No Op</div>
-            </div>
-            <div class="metric-container">
-                <div class="metric-label">Level 1</div>
-                <div class="metric-value">{metric_L1_Op_third_day}<span class="metric-delta {get_delta_color(delta_L1_Op_third_day)}">{delta_L1_Op_third_day}</span></div>
-                <div class="metric-value">{metric_L1_No_Op_third_day}<span class="metric-delta {get_delta_color(delta_L1_No_Op_third_day)}">{delta_L1_No_Op_third_day}</span></div>
-            </div>
-            <div class="metric-container">
-                <div class="metric-label">Level 2</div>
-                <div class="metric-value">{metric_L2_Op_third_day}<span class="metric-delta {get_delta_color(delta_L2_Op_third_day)}">{delta_L2_Op_third_day}</span></div>
-                <div class="metric-value">{metric_L2_No_Op_third_day}<span class="metric-delta {get_delta_color(delta_L2_No_Op_third_day)}">{delta_L2_No_Op_third_day}</span></div>
-            </div>
-            <div class="metric-container">
-                <div class="metric-label">Level 3</div>
-                <div class="metric-value">{metric_L3_Op_third_day}<span class="metric-delta {get_delta_color(delta_L3_Op_third_day)}">{delta_L3_Op_third_day}</span></div>
-                <div class="metric-value">{metric_L3_No_Op_third_day}<span class="metric-delta {get_delta_color(delta_L3_No_Op_third_day)}">{delta_L3_No_Op_third_day}</span></div>
-            </div>
-        </div>
-    """, unsafe_allow_html=True)
-
-
-# Testing deploy    
-# Only auto-refresh the page every 5 minutes if within work hours
 if is_within_work_hours():
-    # st_autorefresh will automatically rerun the app every 300 seconds (5 minutes)
-    count = st_autorefresh(interval=300 * 1000, limit=None, key="autorefresh")
-    st.write("Page will refresh every 5 minutes between 7 AM and 7 PM on weekdays.")
+    st.write("Numbers update automatically between 7 AM and 7 PM on weekdays.")
 else:
-    st.write("Outside of working hours, the page will not refresh.")
\ No newline at end of file
+    st.write("Outside of working hours, the page will not refresh.")
@@ -0,0 +1,166 @@
+import datetime
+import threading
+import time
+
+import timestamps
+
+# Overlap subtracted from the last sync time so changes racing the previous sync are not missed
+SYNC_OVERLAP_SECONDS = 60
+
+
+# Function to format a UTC epoch timestamp for the API
+def format_utc(epoch_seconds):
+    return datetime.datetime.fromtimestamp(epoch_seconds, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+# Function to check whether an appointment should still be counted
+def is_live_appointment(appointment):
+    return appointment.get('active', True) and appointment.get('status') != 'Canceled'
+
+
+# Incremental sync of the appointments (and their jobs) inside a time window.
+#
+# A full sync downloads the whole window; after that, each sync only asks for
+# appointments and jobs modified since the previous successful sync and merges
+# them into a compact working set:
+#   - appointments moved into the window are added, moved out are dropped;
+#   - canceled / inactive appointments are dropped;
+#   - jobs whose tags changed are updated, and jobs of new appointments fetched.
+# A full resync still runs every `full_resync_interval` seconds (and whenever the
+# window moves) as a safety net against anything the deltas missed.
+#
+# With a `store`, every sync is also written to it and the working set and sync
+# state are reloaded from it on startup, so a restart resumes with deltas.
+#
+# The fetch callables are supplied by the app:
+#   fetch_window(start, end)         -> iterable of appointment pages in the window
+#   fetch_modified_appointments(since) -> iterable of appointment pages
+#   fetch_jobs(job_ids)              -> dict of job_id -> job
+#   fetch_modified_jobs(since)       -> iterable of job pages
+class SyncEngine:
+    def __init__(self, fetch_window, fetch_modified_appointments, fetch_jobs, fetch_modified_jobs,
+                 full_resync_interval=3600, store=None):
+        self._fetch_window = fetch_window
+        self._fetch_modified_appointments = fetch_modified_appointments
+        self._fetch_jobs = fetch_jobs
+        self._fetch_modified_jobs = fetch_modified_jobs
+        self.full_resync_interval = full_resync_interval
+        self._lock = threading.Lock()
+        self._window = None
+        self._window_bounds = None
+        self._last_sync = None
+        self._last_full_sync = None
+        # Working set, trimmed to the fields aggregation needs
+        self.appointments = {}
+        self.jobs = {}
+        self.store = store
+        if store is not None:
+            self._load_from_store()
+
+    # Bring the working set up to date for the window [start_utc, end_utc); returns "full" or "delta"
+    def sync(self, start_utc, end_utc):
+        with self._lock:
+            now = time.time()
+            window = (start_utc, end_utc)
+            needs_full = (
+                self._last_sync is None
+                or self._window != window
+                or now - self._last_full_sync >= self.full_resync_interval
+            )
+            previous_appointments, previous_jobs = self.appointments, self.jobs
+            if needs_full:
+                self._full_sync(window)
+                self._last_full_sync = now
+                mode = 'full'
+            else:
+                self._delta_sync(format_utc(self._last_sync - SYNC_OVERLAP_SECONDS))
+                mode = 'delta'
+            # Only advance the sync point once the whole sync succeeded
+            self._last_sync = now
+            if self.store is not None:
+                self._save_to_store(previous_appointments, previous_jobs, replace=needs_full)
+            return mode
+
+    # Force the next sync to download the whole window again
+    def reset(self):
+        with self._lock:
+            self._last_sync = None
+
+    def _load_from_store(self):
+        window = self.store.get_state('window')
+        if window is None:
+            return
+        self.appointments, self.jobs = self.store.load()
+        self._window = tuple(window)
+        self._window_bounds = tuple(timestamps.parse_timestamp(bound) for bound in self._window)
+        self._last_sync = self.store.get_state('last_sync')
+        self._last_full_sync = self.store.get_state('last_full_sync', 0)
+
+    # Write only what changed since the previous working set (everything after a full sync)
+    def _save_to_store(self, previous_appointments, previous_jobs, replace):
+        if replace:
+            upsert_appointments = list(self.appointments.values())
+            upsert_jobs = list(self.jobs.values())
+        else:
+            upsert_appointments = [a for i, a in self.appointments.items() if previous_appointments.get(i) != a]
+            upsert_jobs = [j for i, j in self.jobs.items() if previous_jobs.get(i) != j]
+        self.store.apply(
+            upsert_appointments=upsert_appointments,
+            delete_appointment_ids=[] if replace else [i for i in previous_appointments if i not in self.appointments],
+            upsert_jobs=upsert_jobs,
+            delete_job_ids=[] if replace else [i for i in previous_jobs if i not in self.jobs],
+            replace=replace,
+            state={'window': list(self._window), 'last_sync': self._last_sync,
+                   'last_full_sync': self._last_full_sync})
+
+    def _in_window(self, appointment):
+        start = timestamps.parse_timestamp(appointment['start'])
+        window_start, window_end = self._window_bounds
+        return window_start <= start < window_end
+
+    def _full_sync(self, window):
+        appointments = {}
+        for page in self._fetch_window(*window):
+            for appointment in page:
+                if is_live_appointment(appointment):
+                    appointments[appointment['id']] = self._slim_appointment(appointment)
+
+        jobs = self._fetch_jobs([str(appointment['jobId']) for appointment in appointments.values()])
+
+        self._window = window
+        self._window_bounds = tuple(timestamps.parse_timestamp(bound) for bound in window)
+        self.appointments = appointments
+        self.jobs = {job_id: self._slim_job(job) for job_id, job in jobs.items()}
+
+    def _delta_sync(self, since):
+        appointments = dict(self.appointments)
+        for page in self._fetch_modified_appointments(since):
+            for appointment in page:
+                if is_live_appointment(appointment) and self._in_window(appointment):
+                    appointments[appointment['id']] = self._slim_appointment(appointment)
+                else:
+                    # Rescheduled out of the window, canceled or deactivated
+                    appointments.pop(appointment['id'], None)
+
+        jobs = dict(self.jobs)
+        for page in self._fetch_modified_jobs(since):
+            for job in page:
+                if job['id'] in jobs:
+                    jobs[job['id']] = self._slim_job(job)
+
+        # Jobs of appointments that just entered the window
+        referenced = {appointment['jobId'] for appointment in appointments.values()}
+        missing = [str(job_id) for job_id in referenced if job_id not in jobs]
+        if missing:
+            jobs.update({job_id: self._slim_job(job) for job_id, job in self._fetch_jobs(missing).items()})
+
+        self.appointments = appointments
+        self.jobs = {job_id: job for job_id, job in jobs.items() if job_id in referenced}
+
+    @staticmethod
+    def _slim_appointment(appointment):
+        return {'id': appointment['id'], 'jobId': appointment['jobId'], 'start': appointment['start']}
+
+    @staticmethod
+    def _slim_job(job):
+        return {'id': job['id'], 'tagTypeIds': sorted(job.get('tagTypeIds', []))}
@@ -0,0 +1,43 @@
+import numpy as np
+
+
+# Aggregation over a tag-membership matrix: one row per appointment, one column
+# per tracked tag type (in the order of `tag_type_ids`, a name -> tagTypeId map).
+# Counts for every day x tag combination come out of a single vectorized pass.
+class TagMatrix:
+    def __init__(self, tag_type_ids):
+        self.names = list(tag_type_ids)
+        self._columns = {tag_type_id: column for column, tag_type_id in enumerate(tag_type_ids.values())}
+
+    # Function to build the boolean membership matrix for appointments and a job_id -> job map
+    def build(self, appointments, jobs):
+        rows = []
+        columns = []
+        for row, appointment in enumerate(appointments):
+            job = jobs.get(appointment['jobId'])
+            if not job:
+                continue
+            for tag_type_id in job.get('tagTypeIds', ()):
+                column = self._columns.get(tag_type_id)
+                if column is not None:
+                    rows.append(row)
+                    columns.append(column)
+
+        matrix = np.zeros((len(appointments), len(self.names)), dtype=bool)
+        matrix[rows, columns] = True
+        return matrix
+
+    # Function to count tagged appointments per day: `day_indexes[i]` is the day
+    # (0..day_count-1) of appointment i, or -1 to leave it out. Returns a
+    # day_count x tag_count integer array.
+    def count_by_day(self, matrix, day_indexes, day_count):
+        day_indexes = np.asarray(day_indexes, dtype=np.int64)
+        rows, columns = np.nonzero(matrix)
+        days = day_indexes[rows] if len(rows) else rows
+        keep = days >= 0
+        cells = days[keep] * len(self.names) + columns[keep]
+        return np.bincount(cells, minlength=day_count * len(self.names)).reshape(day_count, len(self.names))
+
+    # Function to go straight from appointments to per-day counts
+    def count(self, appointments, jobs, day_indexes, day_count):
+        return self.count_by_day(self.build(appointments, jobs), day_indexes, day_count)
@@ -0,0 +1,128 @@
+import datetime
+import json
+import os
+import sys
+import threading
+import time
+
+# Overlap subtracted from the last sync so edits racing it are not missed
+SYNC_OVERLAP_SECONDS = 60
+
+
+# Process-wide technician directory: technician ID -> (name, team), loaded from
+# the technicians endpoint in bulk and shared by every view that labels technicians.
+#
+# `refresh()` is cheap to call on every run: the whole directory is downloaded
+# only when it is empty or older than `refresh_interval` seconds; in between,
+# every `check_interval` seconds only the technicians modified since the last
+# sync are fetched and merged in. Team names are interned, so the directory is
+# one small tuple per technician. With `cache_path` it is persisted, so restarts
+# start from it and pick up changes with an incremental sync.
+#
+# The fetch callables are supplied by the app:
+#   fetch_technicians()                -> iterable of technician pages (all of them)
+#   fetch_modified_technicians(since)  -> iterable of pages of technicians modified since then
+class TechnicianDirectory:
+    def __init__(self, fetch_technicians, fetch_modified_technicians, refresh_interval=86400, check_interval=900,
+                 cache_path=None):
+        self._fetch_technicians = fetch_technicians
+        self._fetch_modified_technicians = fetch_modified_technicians
+        self.refresh_interval = refresh_interval
+        self.check_interval = check_interval
+        self._cache_path = cache_path
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._fetched_at = 0.0
+        self._synced_at = 0.0
+        self.full_fetches = 0
+        self.delta_syncs = 0
+        self._load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, technician_id):
+        return technician_id in self._entries
+
+    def name(self, technician_id, default=None):
+        entry = self._entries.get(technician_id)
+        return entry[0] if entry else default
+
+    def team(self, technician_id, default=None):
+        entry = self._entries.get(technician_id)
+        return entry[1] if entry and entry[1] is not None else default
+
+    # Function to bring the directory up to date when a full reload or an incremental sync is due
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.time()
+            if force or not self._entries or now - self._fetched_at >= self.refresh_interval:
+                entries = {}
+                for technicians in self._fetch_technicians():
+                    self._merge(entries, technicians)
+                self._entries = entries
+                self._fetched_at = self._synced_at = now
+                self.full_fetches += 1
+            elif now - self._synced_at >= self.check_interval:
+                since = datetime.datetime.fromtimestamp(self._synced_at - SYNC_OVERLAP_SECONDS, datetime.timezone.utc)
+                entries = dict(self._entries)
+                for technicians in self._fetch_modified_technicians(since.strftime('%Y-%m-%dT%H:%M:%SZ')):
+                    self._merge(entries, technicians)
+                # Swap in the merged copy so readers on other threads never see a half-applied sync
+                self._entries = entries
+                self._synced_at = now
+                self.delta_syncs += 1
+            else:
+                return
+            self._save()
+
+    # Function to describe the directory for the debug panel
+    def stats(self):
+        return {
+            'technicians': len(self._entries),
+            'teams': len({team for _, team in self._entries.values() if team is not None}),
+            'fetched_seconds_ago': round(time.time() - self._fetched_at) if self._fetched_at else None,
+            'synced_seconds_ago': round(time.time() - self._synced_at) if self._synced_at else None,
+            'full_fetches': self.full_fetches,
+            'delta_syncs': self.delta_syncs,
+        }
+
+    @staticmethod
+    def _merge(entries, technicians):
+        for technician in technicians:
+            team = technician.get('team')
+            entries[technician['id']] = (technician.get('name') or '', sys.intern(team) if team else None)
+
+    # Adopt a persisted directory (it is kept current by the usual refresh rules)
+    def _load(self):
+        if self._cache_path is None:
+            return
+        try:
+            with open(self._cache_path) as f:
+                cached = json.load(f)
+            entries = {technician_id: (name, sys.intern(team) if team else None)
+                       for technician_id, name, team in cached['technicians']}
+            fetched_at, synced_at = cached['fetched_at'], cached['synced_at']
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        self._entries, self._fetched_at, self._synced_at = entries, fetched_at, synced_at
+
+    def _save(self):
+        if self._cache_path is None:
+            return
+        tmp_path = f'{self._cache_path}.{os.getpid()}.tmp'
+        try:
+            # Write-then-rename so readers never see a partial file
+            with open(tmp_path, 'w') as f:
+                json.dump({
+                    'fetched_at': self._fetched_at,
+                    'synced_at': self._synced_at,
+                    'technicians': [[technician_id, name, team] for technician_id, (name, team) in self._entries.items()],
+                }, f, separators=(',', ':'))
+            os.replace(tmp_path, self._cache_path)
+        except OSError:
+            # Persistence is best effort; the in-memory directory is still valid
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
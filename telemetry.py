@@ -0,0 +1,221 @@
+import functools
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+
+def _label_key(labels):
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{value.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+               for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == math.inf else repr(float(bound))
+
+
+# In-process metrics registry: labelled counters, labelled timing histograms and
+# callback gauges/counters read at export time (e.g. cache statistics). Every
+# metric name is prefixed with `namespace`. Thread-safe; rendering produces the
+# Prometheus text exposition format.
+class Metrics:
+    def __init__(self, namespace="aq_dashboard", buckets=DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._help = {}
+        self._counters = {}
+        self._histograms = {}
+        self._callbacks = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                # [per-bucket counts, sum, count, last, max]
+                state = series[key] = [[0] * len(self.buckets), 0.0, 0, 0.0, 0.0]
+            for position, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    state[0][position] += 1
+                    break
+            state[1] += seconds
+            state[2] += 1
+            state[3] = seconds
+            state[4] = max(state[4], seconds)
+
+    # Time a block as one observation of the `phase_seconds` histogram
+    @contextmanager
+    def span(self, phase):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("phase_seconds", time.perf_counter() - started, phase=phase)
+
+    # Decorator form of `span`
+    def timed(self, phase):
+        def decorator(function):
+            @functools.wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.span(phase):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # Function to time an iterator (e.g. a page stream): one observation covering only the
+    # time spent producing items, not the time the consumer spends on them
+    def timed_iter(self, phase, iterable):
+        elapsed = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                started = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - started
+                yield item
+        finally:
+            self.observe("phase_seconds", elapsed, phase=phase)
+
+    # Export a value read at scrape time. `read()` returns a number, or a dict of
+    # {label tuple such as (("family", "jpm"),): number}; `labels` are added to every
+    # series it returns, so the same metric can be registered once per tenant.
+    def register(self, name, kind, help_text, read, **labels):
+        self._help[name] = help_text
+        with self._lock:
+            self._callbacks.setdefault(name, (kind, []))[1].append((read, _label_key(labels)))
+
+    # Function to summarize the phase timings and counters (for the debug panel)
+    def summary(self):
+        with self._lock:
+            phases = {
+                dict(key).get("phase", "?"): {
+                    "count": state[2],
+                    "avg_ms": round(state[1] / state[2] * 1000, 1) if state[2] else 0.0,
+                    "last_ms": round(state[3] * 1000, 1),
+                    "max_ms": round(state[4] * 1000, 1),
+                }
+                for key, state in self._histograms.get("phase_seconds", {}).items()
+            }
+            counters = {
+                name + _format_labels(key): value
+                for name, series in sorted(self._counters.items()) for key, value in sorted(series.items())
+            }
+        return {"phases": phases, "counters": counters}
+
+    def render_prometheus(self):
+        lines = []
+
+        def header(name, kind):
+            full_name = f"{self.namespace}_{name}"
+            if name in self._help:
+                lines.append(f"# HELP {full_name} {self._help[name]}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            return full_name
+
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: [list(state[0])] + state[1:] for key, state in series.items()}
+                          for name, series in self._histograms.items()}
+
+        for name, series in sorted(counters.items()):
+            full_name = header(name, "counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{full_name}{_format_labels(key)} {value}")
+
+        for name, series in sorted(histograms.items()):
+            full_name = header(name, "histogram")
+            for key, (bucket_counts, total, count, _, _) in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"{full_name}_bucket{_format_labels(key, [('le', _format_bound(bound))])} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{full_name}_count{_format_labels(key)} {count}")
+
+        with self._lock:
+            callbacks = {name: (kind, list(reads)) for name, (kind, reads) in self._callbacks.items()}
+        for name, (kind, reads) in callbacks.items():
+            full_name = header(name, kind)
+            for read, labels in reads:
+                try:
+                    value = read()
+                except Exception:
+                    logger.warning("Could not read metric %s", name, exc_info=True)
+                    continue
+                for key, series_value in (value.items() if isinstance(value, dict) else [((), value)]):
+                    lines.append(f"{full_name}{_format_labels(labels, key)} {series_value}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Local HTTP endpoint serving `metrics` in the Prometheus text format for scraping
+class MetricsEndpoint:
+    def __init__(self, metrics, host="127.0.0.1", port=9108, path="/metrics"):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.path = path
+        self._server = None
+
+    # Function to start serving on a daemon thread; returns None if the port cannot be bound
+    def start(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != endpoint.path:
+                    self.send_error(404)
+                    return
+                body = endpoint.metrics.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        except OSError as e:
+            logger.warning("Metrics endpoint not started on %s:%s: %s", self.host, self.port, e)
+            return None
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-endpoint", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
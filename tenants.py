@@ -0,0 +1,75 @@
+import os
+from dataclasses import dataclass
+
+# Key of the only tenant when the secrets have no [tenants] table
+DEFAULT_TENANT_KEY = "default"
+
+# Secrets every tenant needs; a tenant table can leave out any that are shared at the top level
+CREDENTIAL_KEYS = ("tenant", "client_id", "client_secret", "st_app_key")
+
+
+# One ServiceTitan tenant served by this process: its credentials, the tags and
+# targets its board tracks, and where its on-disk state lives.
+@dataclass(frozen=True)
+class TenantConfig:
+    key: str
+    name: str
+    tenant: str
+    client_id: str
+    client_secret: str
+    st_app_key: str
+    tag_type_ids: dict
+    targets: dict
+    store_path: str = None
+    token_cache_path: str = None
+    rate_limit_state_path: str = None
+    shared_snapshot_path: str = None
+
+
+# Function to add the tenant key to a shared file path ("aq_dashboard.db" -> "aq_dashboard.north.db")
+def tenant_path(path, key):
+    if not path:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{key}{extension}"
+
+
+# Function to read the tenants from the secrets. With a [tenants.<key>] table per
+# tenant, each table can override the credentials, name, tag_type_ids, targets and
+# file paths; anything it leaves out comes from the top level, with file paths
+# suffixed by the tenant key so tenants never share on-disk state. Without a
+# [tenants] table the top-level secrets describe the single "default" tenant.
+# Returns {key: TenantConfig} in the order the tenants are listed.
+def load_tenants(secrets, default_tag_type_ids, default_targets, default_store_path=None,
+                 default_rate_limit_state_path=None):
+    tables = secrets.get("tenants")
+    shared_paths = {
+        "store_path": secrets.get("store_path", default_store_path),
+        "token_cache_path": secrets.get("token_cache_path"),
+        "rate_limit_state_path": secrets.get("rate_limit_state_path", default_rate_limit_state_path),
+        "shared_snapshot_path": secrets.get("shared_snapshot_path"),
+    }
+    multi_tenant = bool(tables)
+
+    configs = {}
+    for key, table in (tables if multi_tenant else {DEFAULT_TENANT_KEY: {}}).items():
+        credentials = {name: str(table.get(name, secrets.get(name, ""))) for name in CREDENTIAL_KEYS}
+        missing = [name for name, value in credentials.items() if not value]
+        if missing:
+            raise ValueError(f"Tenant {key!r} is missing {', '.join(missing)} in the secrets")
+        tag_type_ids = dict(default_tag_type_ids)
+        tag_type_ids.update(secrets.get("tag_type_ids", {}))
+        tag_type_ids.update(table.get("tag_type_ids", {}))
+        targets = dict(default_targets)
+        targets.update({name: int(value) for name, value in secrets.get("targets", {}).items()})
+        targets.update({name: int(value) for name, value in table.get("targets", {}).items()})
+        configs[key] = TenantConfig(
+            key=key,
+            name=table.get("name", key),
+            tag_type_ids=tag_type_ids,
+            targets=targets,
+            **credentials,
+            **{name: table.get(name, tenant_path(path, key) if multi_tenant else path)
+               for name, path in shared_paths.items()},
+        )
+    return configs
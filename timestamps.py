@@ -0,0 +1,84 @@
+import datetime
+
+import numpy as np
+from dateutil import parser
+
+# UTC offsets only change on quarter-hour boundaries, so one offset lookup per
+# quarter hour covers every instant inside it
+OFFSET_BUCKET_SECONDS = 900
+SECONDS_PER_DAY = 86400
+
+
+def _is_fixed_format(value):
+    # "YYYY-MM-DDTHH:MM:SS" + optional ".fraction" + "Z", the format ServiceTitan sends
+    return isinstance(value, str) and len(value) >= 20 and value[-1] == 'Z' and value[10] == 'T' and value[19] in '.Z'
+
+
+# Function to parse a ServiceTitan timestamp ("2024-05-01T14:00:00Z", optionally with up
+# to 7 fractional digits) into an aware UTC datetime. The fixed format is sliced
+# directly; any other ISO-8601 form falls back to dateutil (naive values are UTC).
+def parse_timestamp(value):
+    if _is_fixed_format(value):
+        microsecond = int(value[20:-1][:6].ljust(6, '0')) if value[19] == '.' else 0
+        return datetime.datetime.fromisoformat(value[:19]).replace(microsecond=microsecond,
+                                                                    tzinfo=datetime.timezone.utc)
+    parsed = parser.isoparse(value)
+    return parsed if parsed.tzinfo is not None else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+# Function to get the local date of one timestamp in `tz`
+def local_date(value, tz):
+    return parse_timestamp(value).astimezone(tz).date()
+
+
+# Function to convert a column of timestamps to a datetime64[s] array of UTC instants in
+# one pass (NaT where a value cannot be parsed). Fixed-format values are handed to
+# numpy's C parser with their fraction and "Z" cut off; others go through parse_timestamp.
+def to_instants(values):
+    values = list(values)
+    heads = []
+    others = []
+    for position, value in enumerate(values):
+        if _is_fixed_format(value):
+            heads.append(value[:19])
+        else:
+            heads.append('NaT')
+            others.append(position)
+    try:
+        instants = np.array(heads, dtype='datetime64[s]')
+    except ValueError:
+        # A value looked like the fixed format but is not a valid timestamp
+        instants = np.array([_to_instant(head) for head in heads], dtype='datetime64[s]')
+    for position in others:
+        try:
+            instants[position] = np.datetime64(int(parse_timestamp(values[position]).timestamp()), 's')
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return instants
+
+
+def _to_instant(head):
+    try:
+        return np.datetime64(head, 's')
+    except ValueError:
+        return np.datetime64('NaT', 's')
+
+
+# Function to bucket a column of timestamps by their local date in `tz`: returns a
+# datetime64[D] array (NaT where a value cannot be parsed; `.tolist()` gives dates
+# and None). The zone is consulted once per distinct quarter hour in the column, not
+# once per row, so this stays correct across DST changes in zones that have them.
+def local_dates(values, tz):
+    instants = to_instants(values)
+    dates = np.full(len(instants), np.datetime64('NaT'), dtype='datetime64[D]')
+    valid = ~np.isnat(instants)
+    if not valid.any():
+        return dates
+    seconds = instants[valid].astype(np.int64)
+    buckets, inverse = np.unique(seconds // OFFSET_BUCKET_SECONDS, return_inverse=True)
+    offsets = np.array([
+        datetime.datetime.fromtimestamp(int(bucket) * OFFSET_BUCKET_SECONDS, tz).utcoffset().total_seconds()
+        for bucket in buckets
+    ], dtype=np.int64)
+    dates[valid] = ((seconds + offsets[inverse]) // SECONDS_PER_DAY).astype('datetime64[D]')
+    return dates